@@ -1,35 +1,150 @@
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import os
+import sys
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# orjson is much faster at decoding the chart payloads; fall back to stdlib json
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 # Define paths
 current_dir = os.path.dirname(os.path.abspath(__file__))
 input_csv = os.path.join(current_dir, 'vietnam_tickers.csv')
 output_csv = os.path.join(current_dir, 'vietnam_tickers_checked.csv')
+cache_file = os.path.join(current_dir, '.yf_validity_cache.json')
 
-# Load CSV
-print(f"Reading from {input_csv}...")
-try:
-    df = pd.read_csv(input_csv)
-except FileNotFoundError:
-    print(f"Error: Could not find {input_csv}")
-    exit(1)
+# Validity rarely changes, so reuse results for a week (pass --refresh to ignore the cache)
+CACHE_TTL = 7 * 24 * 3600
+REFRESH = '--refresh' in sys.argv
 
 # Headers to mimic a browser to avoid being blocked
 headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 }
 
+# Number of concurrent requests in flight (also the connection pool size)
+MAX_WORKERS = 16
+
+# Shared session so every request reuses the same keep-alive connection to Yahoo
+SESSION = requests.Session()
+SESSION.headers.update(headers)
+SESSION.headers['Accept-Encoding'] = 'gzip, deflate'
+adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=MAX_WORKERS,
+    # 429 is left to BUCKET below so the request rate adapts to throttling
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504])
+)
+SESSION.mount("https://", adapter)
+
+class TokenBucket:
+    """
+    Thread-safe token bucket whose rate adapts AIMD-style: halved on throttling,
+    increased by a fixed step after every `increase_every` successful requests.
+    """
+
+    def __init__(self, rate, capacity, min_rate=1.0, max_rate=100.0, increase_step=0.5, increase_every=20):
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.increase_every = increase_every
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.successes = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.successes += 1
+            if self.successes >= self.increase_every:
+                self.successes = 0
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self, retry_after):
+        with self.lock:
+            self.successes = 0
+            self.rate = max(self.min_rate, self.rate * 0.5)
+            self.tokens = 0
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+BUCKET = TokenBucket(rate=20.0, capacity=MAX_WORKERS)
+MAX_THROTTLE_RETRIES = 3
+
+def get_with_rate_limit(url):
+    """GET through BUCKET, backing off and retrying when Yahoo answers 429."""
+    for _ in range(MAX_THROTTLE_RETRIES + 1):
+        BUCKET.acquire()
+        response = SESSION.get(url, timeout=5)
+        if response.status_code != 429:
+            BUCKET.on_success()
+            return response
+        try:
+            retry_after = float(response.headers.get('Retry-After', 1))
+        except ValueError:
+            retry_after = 1.0
+        BUCKET.on_throttle(retry_after)
+    return response
+
+def load_cache():
+    if REFRESH or not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    # Entries are {symbol: [is_valid, checked_at]}; drop the expired ones
+    now = time.time()
+    return {k: v for k, v in cache.items() if now - v[1] < CACHE_TTL}
+
+def save_cache(cache):
+    with open(cache_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+
+CACHE = load_cache()
+
+def check_symbol_cached(symbol):
+    cached = CACHE.get(symbol)
+    if cached is not None:
+        return cached[0]
+    return check_symbol_validity(symbol)
+
 def check_symbol_validity(symbol):
-    # Using a short range to be fast
-    url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?range=1d&interval=1d"
+    # Smallest possible payload: one daily bar, no pre/post-market data, no events
+    url = (
+        f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+        "?range=1d&interval=1d&includePrePost=false&events="
+    )
     try:
-        response = requests.get(url, headers=headers, timeout=5)
+        response = get_with_rate_limit(url)
         if response.status_code == 200:
             try:
-                data = response.json()
+                data = json_loads(response.content)
                 chart = data.get('chart', {})
                 result = chart.get('result')
                 error = chart.get('error')
@@ -39,44 +154,63 @@ def check_symbol_validity(symbol):
                     return 0
                 
                 if result and len(result) > 0:
-                    # Check if we actually have quotes
-                    indicators = result[0].get('indicators', {}).get('quote', [{}])[0]
-                    if indicators and (len(indicators.get('close', [])) > 0 or len(indicators.get('open', [])) > 0):
-                         return 1
-                    
-                    # Sometimes result exists but is empty meta data
-                    return 0
+                    # A traded symbol reports its market price in meta; no need to walk the quotes
+                    meta = result[0].get('meta') or {}
+                    return 1 if meta.get('regularMarketPrice') is not None else 0
                 else:
                     return 0
             except json.JSONDecodeError:
                 return 0
-        else:
+        elif response.status_code == 404:
+            # Unknown symbol
             return 0
+        else:
+            # Transient failure, leave it out of the cache
+            return None
     except Exception as e:
         print(f"Error checking {symbol}: {e}")
-        return 0
-
-print(f"Checking {len(df)} symbols...")
-
-# Add column
-results = []
-total = len(df)
-
-for index, row in df.iterrows():
-    symbol = row['Symbol']
-    is_valid = check_symbol_validity(symbol)
-    results.append(is_valid)
-    
-    # Print progress
-    if (index + 1) % 50 == 0:
-        print(f"Checked {index + 1}/{total} symbols... (Found {sum(results)} valid so far)")
-    
-    # Sleep slightly to avoid rate limiting
-    time.sleep(0.05)
-
-df['add_to_asset'] = results
-
-# Save
-df.to_csv(output_csv, index=False)
-print(f"Done! Saved to {output_csv}")
-print(f"Total valid symbols: {df['add_to_asset'].sum()} / {total}")
+        return None
+
+def main():
+    # Load CSV
+    print(f"Reading from {input_csv}...")
+    try:
+        df = pd.read_csv(input_csv)
+    except FileNotFoundError:
+        print(f"Error: Could not find {input_csv}")
+        exit(1)
+
+    print(f"Checking {len(df)} symbols ({len(CACHE)} cached)...")
+
+    # Add column
+    total = len(df)
+    symbols = df['Symbol'].to_numpy()
+    results = np.zeros(total, dtype=np.int8)
+    valid_count = 0
+
+    # Requests are pure I/O, so overlap them across a thread pool sharing SESSION.
+    # Request rate is paced by BUCKET, which backs off on 429.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for index, is_valid in enumerate(executor.map(check_symbol_cached, symbols)):
+            if is_valid is None:
+                is_valid = 0
+            elif symbols[index] not in CACHE:
+                CACHE[symbols[index]] = [is_valid, time.time()]
+            results[index] = is_valid
+            valid_count += is_valid
+
+            # Print progress
+            if (index + 1) % 50 == 0:
+                print(f"Checked {index + 1}/{total} symbols... (Found {valid_count} valid so far)")
+
+    save_cache(CACHE)
+
+    df['add_to_asset'] = results
+
+    # Save
+    df.to_csv(output_csv, index=False)
+    print(f"Done! Saved to {output_csv}")
+    print(f"Total valid symbols: {df['add_to_asset'].sum()} / {total}")
+
+if __name__ == '__main__':
+    main()
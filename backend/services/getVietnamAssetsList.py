@@ -15,17 +15,18 @@ df_listings = listing.all_symbols()
 # Các cột trong DataFrame thường là:
 # 'ticker' (Symbol), 'companyName' (Name), 'groupCode' (Exchange/Sàn)
 
-df_output = df_listings[['symbol', 'organ_name']]
+df_output = df_listings[['symbol', 'organ_name']].copy()
 print(df_listings.head(5))
 
 # Đổi tên cột cho dễ hiểu (tùy chọn)
-df_output.columns = ['Symbol', 'Name']
+df_output = df_output.rename(columns={'symbol': 'Symbol', 'organ_name': 'Name'})
 
 # Add a new column 'Exchange' with default value 'VnStock'
 df_output['Exchange'] = 'VnStock'
 
 # Append '.VN' to all values in the 'Symbol' column
-df_output['Symbol'] = df_output['Symbol'] + '.VN'
+# (string column, concatenated in a single vectorized pass)
+df_output['Symbol'] = df_output['Symbol'].astype('string') + '.VN'
 
 print(df_output.head())
 
@@ -0,0 +1,58 @@
+import importlib.util
+import os
+
+import pytest
+
+MODULE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'check_vn_tickers_validity.py')
+
+
+@pytest.fixture
+def checker(monkeypatch):
+    spec = importlib.util.spec_from_file_location('check_vn_tickers_validity', MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # Fast bucket so throttled retries don't sleep
+    monkeypatch.setattr(module, 'BUCKET', module.TokenBucket(rate=1000.0, capacity=100, min_rate=1000.0))
+    return module
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b'{}', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+def stub_session(monkeypatch, module, responses):
+    calls = []
+
+    def fake_get(url, timeout=None):
+        calls.append(url)
+        return responses.pop(0)
+
+    monkeypatch.setattr(module.SESSION, 'get', fake_get)
+    return calls
+
+
+VALID_PAYLOAD = b'{"chart": {"result": [{"meta": {"regularMarketPrice": 12.5}}], "error": null}}'
+
+
+def test_valid_symbol(monkeypatch, checker):
+    calls = stub_session(monkeypatch, checker, [FakeResponse(200, VALID_PAYLOAD)])
+    assert checker.check_symbol_validity('VNM.VN') == 1
+    assert len(calls) == 1
+
+
+def test_unknown_symbol(monkeypatch, checker):
+    calls = stub_session(monkeypatch, checker, [FakeResponse(404)])
+    assert checker.check_symbol_validity('NOPE.VN') == 0
+    assert len(calls) == 1
+
+
+def test_throttled_request_is_retried(monkeypatch, checker):
+    calls = stub_session(monkeypatch, checker, [
+        FakeResponse(429, headers={'Retry-After': '0'}),
+        FakeResponse(200, VALID_PAYLOAD),
+    ])
+    assert checker.check_symbol_validity('VNM.VN') == 1
+    assert len(calls) == 2
@@ -1,96 +1,360 @@
 # finance_agent/agent.py
-import json
+import asyncio
+import copy
 import logging
 import datetime
+import functools
+import hashlib
 import re
 import inspect
-from collections import defaultdict, deque
-from typing import List, Dict, Any, Tuple, Callable, Optional
+import itertools
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Tuple, Callable, Optional, Deque
 
 from .models import SubQuestion
-from .utils import configure_logging
+from .utils import TTLCache, configure_logging, json_dumps, json_loads
 from .gemini_wrapper import GeminiWrapper
-from .tool_registry import registry
-from .vector_index import build_tool_vector_index_from_registry
+from .tool_registry import ToolMeta, registry
 from .prompts import (
     GENERATE_SUBQUESTION_SYSTEM_PROMPT_TEMPLATE,
-    SUBQUESTION_ANSWER_PROMPT,
     FINAL_ANSWER_PROMPT,
+    SUBQUESTION_RESPONSE_SCHEMA,
+    render_subq_prompt,
 )
 
 logger = logging.getLogger(__name__)
 
 PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*([A-Z0-9_]+)\s*\}\}")
+_PLACEHOLDER_INNER = re.compile(r"^(.+?)_FROM_Q(\d+)$")
+_FENCE_OPEN_RE = re.compile(r"^```[a-zA-Z0-9]*\n?")
+_FENCE_CLOSE_RE = re.compile(r"```$")
+_KV_SPLIT_RE = re.compile(r"[,;\n]")
 
+# Max subquestions answered concurrently (LLM + tool round-trips in flight)
+MAX_SUBQUESTION_WORKERS = 8
 
-def topo_sort_subquestions(subquestions: List[Dict]) -> List[Dict]:
+# Max characters of each subquestion answer included in the final aggregation prompt
+MAX_SUBANSWER_CHARS = 2000
+
+# Exchanges kept in each agent's conversation history
+MAX_HISTORY_EXCHANGES = 10
+
+# Repeated context-free queries within ANSWER_CACHE_TTL seconds reuse the previous answer, across agents
+ANSWER_CACHE_SIZE = 512
+ANSWER_CACHE_TTL = 300
+
+# Plans for a query asked without prior conversation context are shared across agents
+SUBQUESTION_CACHE_SIZE = 512
+SUBQUESTION_CACHE_TTL = 3600
+
+# Tools that change user data; answers that used them are never cached
+_MUTATING_TOOLS = frozenset({
+    "pfm_add_expense",
+    "pfm_add_income",
+    "pfm_add_to_watchlist",
+    "pfm_remove_from_watchlist",
+})
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _answer_cache_key(user_query: str, token: Optional[str], model: Optional[str] = None) -> str:
+    """Hash the whitespace-collapsed, lowercased query together with the user's token and the model."""
+    normalized = _WHITESPACE_RE.sub(" ", user_query.strip().lower())
+    h = hashlib.blake2b(digest_size=16)
+    h.update(normalized.encode("utf-8"))
+    h.update(b"\0")
+    h.update((token or "").encode("utf-8"))
+    h.update(b"\0")
+    h.update((model or "").encode("utf-8"))
+    return h.hexdigest()
+
+
+# (epoch second, ISO string) of the last timestamp handed out by _utc_now_iso
+_TS_CACHE: Tuple[int, str] = (0, "")
+
+
+def _utc_now_iso() -> str:
+    """Current UTC time in ISO format at second granularity, formatted once per second."""
+    global _TS_CACHE
+    now_s = int(time.time())
+    cached = _TS_CACHE
+    if cached[0] != now_s:
+        cached = _TS_CACHE = (now_s, datetime.datetime.fromtimestamp(now_s, datetime.timezone.utc).isoformat())
+    return cached[1]
+
+
+_SUBQUESTION_CACHE = TTLCache(maxsize=SUBQUESTION_CACHE_SIZE, ttl=SUBQUESTION_CACHE_TTL)
+_ANSWER_CACHE = TTLCache(maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+
+
+# ========== Heuristic tool rules ==========
+# Evaluated in order by FinancialAgent._search_tools. Each rule is
+# (keywords, tool name, prepend, required keywords, excluded keywords):
+# the tool is selected when any keyword occurs in the casefolded subquestion,
+# and, if given, any required keyword occurs and no excluded keyword occurs.
+# Single-word keywords must match a whole word; multi-word phrases match as substrings.
+# Prepended tools go to the front of the list (last match first), others are appended.
+_ADD_WORDS = ("thêm", "add", "new", "tạo", "ghi", "vừa")
+_EXPENSE_WORDS = ("chi tiêu", "expense", "spending", "cost", "mua", "trả tiền", "tốn", "spend", "chi")
+_INCOME_WORDS = ("thu nhập", "income", "lương", "salary", "bonus", "thưởng", "kiếm được", "nhận được")
+_SUMMARY_WORDS = ("tài chính", "financial", "balance", "số dư", "tổng kết", "summary", "báo cáo", "report", "tiền")
+_WATCHLIST_WORDS = ("watchlist", "theo dõi", "track", "quan tâm", "danh sách")
+
+_TOOL_KEYWORD_RULES = (
+    # Stock symbol lookup
+    (("mã cổ phiếu", "ticker", "symbol", "mã chứng khoán"), "get_stock_symbol", True, None, None),
+    # Sector/Industry classification
+    (("ngành", "sector", "industry", "lĩnh vực", "thuộc ngành"), "get_sector_mapping", True, None, None),
+    # Macro economic data
+    (("lạm phát", "inflation", "cpi", "gdp", "thất nghiệp", "unemployment",
+      "lãi suất", "interest rate", "vĩ mô", "macro", "kinh tế vĩ mô"), "get_macro_data", True, None, None),
+    # Exchange information
+    (("sàn", "exchange", "hose", "hnx", "upcom"), "get_exchange_info", True, None, None),
+    # Currency exchange rate
+    (("tỷ giá", "exchange rate", "usd", "vnd", "currency", "đô la", "đồng"), "get_currency_rate", True, None, None),
+    # Income statement / Revenue
+    (("doanh thu", "revenue", "lợi nhuận", "profit", "earnings", "income statement",
+      "kết quả kinh doanh", "ebitda", "net income"), "get_income_statement", True, None, None),
+    # Balance sheet / Equity / Assets
+    (("vốn chủ", "equity", "tài sản", "assets", "nợ", "debt", "liabilities",
+      "bảng cân đối", "balance sheet", "shareholders equity", "total assets"), "get_balance_sheet", True, None, None),
+    # Cash flow analysis
+    (("dòng tiền", "cash flow", "operating cash", "free cash flow", "fcf",
+      "investing cash", "financing cash"), "analyze_cashflow", True, None, None),
+    # Financial ratios
+    (("roe", "roa", "pe", "p/e", "pb", "p/b", "eps", "tỷ số", "chỉ số tài chính",
+      "tỷ lệ", "margin", "biên lợi nhuận"), "calculate_ratios", True, None, None),
+    # Valuation / Fair value
+    (("định giá", "valuation", "fair value", "giá trị hợp lý", "dcf", "ddm", "peg"), "estimate_fair_value", True, None, None),
+    # Technical indicators
+    (("rsi", "macd", "ma", "moving average", "bollinger", "technical",
+      "chỉ báo kỹ thuật", "đường trung bình"), "get_technical_indicators", True, None, None),
+    # Chart / Graph / Visualization
+    (("biểu đồ", "chart", "graph", "vẽ", "draw", "plot", "visualize",
+      "biến động giá", "price movement", "price chart", "lịch sử giá"), "generate_stock_price_chart", True, None, None),
+    # Price / Stock price
+    (("giá", "price", "stock price", "giá cổ phiếu", "thị giá"), "get_stock_price", True, None, None),
+    # Fundamental analysis
+    (("thông tin cơ bản", "fundamental", "profile"), "get_fundamentals", True, None, None),
+    # Risk metrics
+    (("risk", "volatility", "beta", "sharpe", "sortino", "drawdown", "var",
+      "rủi ro", "biến động"), "get_risk_metrics", True, None, None),
+    # PFM: Expense - add when explicitly adding, search as fallback
+    (_EXPENSE_WORDS, "pfm_add_expense", True, _ADD_WORDS, None),
+    (_EXPENSE_WORDS, "pfm_search_expenses", False, None, None),
+    # PFM: Income
+    (_INCOME_WORDS, "pfm_add_income", True, _ADD_WORDS, None),
+    (_INCOME_WORDS, "pfm_search_incomes", False, None, None),
+    # PFM: Dashboard/Summary
+    (_SUMMARY_WORDS, "pfm_get_financial_summary", True, None, None),
+    (_SUMMARY_WORDS, "pfm_get_report_by_time", False, None, None),
+    # PFM: Watchlist
+    (_WATCHLIST_WORDS, "pfm_add_to_watchlist", True, ("thêm", "add", "new"), None),
+    (_WATCHLIST_WORDS, "pfm_remove_from_watchlist", True, ("xóa", "remove", "delete", "bỏ"), ("thêm", "add", "new")),
+    (_WATCHLIST_WORDS, "pfm_get_watchlist", False, None, None),
+)
+
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _compile_keywords(keywords) -> Tuple[frozenset, Tuple[str, ...]]:
+    """Split a keyword group into single words (matched as tokens) and phrases (matched as substrings)."""
+    words = frozenset(k for k in keywords if _TOKEN_RE.fullmatch(k))
+    phrases = tuple(k for k in keywords if k not in words)
+    return words, phrases
+
+
+def _keywords_match(compiled: Tuple[frozenset, Tuple[str, ...]], q: str, tokens: set) -> bool:
+    words, phrases = compiled
+    return not words.isdisjoint(tokens) or any(p in q for p in phrases)
+
+
+def _build_keyword_index(rules) -> Tuple[Dict[str, Tuple[int, ...]], Dict[str, Tuple[Tuple[str, Tuple[int, ...]], ...]]]:
+    """
+    Invert the rule table once at import time: single words map to the indices of the
+    rules they trigger, phrases are bucketed under their first word so a query only
+    substring-checks the phrases whose first word it actually contains.
+    """
+    words: Dict[str, List[int]] = {}
+    phrases: Dict[str, List[int]] = {}
+    for i, (keywords, *_rest) in enumerate(rules):
+        for k in keywords:
+            target = words if _TOKEN_RE.fullmatch(k) else phrases
+            target.setdefault(k, []).append(i)
+    by_first_word: Dict[str, List[Tuple[str, Tuple[int, ...]]]] = {}
+    for phrase, idx in phrases.items():
+        first = _TOKEN_RE.search(phrase).group(0)
+        by_first_word.setdefault(first, []).append((phrase, tuple(idx)))
+    return (
+        {w: tuple(idx) for w, idx in words.items()},
+        {w: tuple(entries) for w, entries in by_first_word.items()},
+    )
+
+
+_KEYWORD_WORD_INDEX, _KEYWORD_PHRASE_INDEX = _build_keyword_index(_TOOL_KEYWORD_RULES)
+
+
+def _matched_rule_indices(q: str, tokens: set) -> set:
+    """Indices of _TOOL_KEYWORD_RULES whose keywords occur in q, in one pass over its tokens."""
+    hits = set()
+    for t in tokens:
+        idx = _KEYWORD_WORD_INDEX.get(t)
+        if idx:
+            hits.update(idx)
+        for phrase, pidx in _KEYWORD_PHRASE_INDEX.get(t, ()):
+            if phrase in q:
+                hits.update(pidx)
+    return hits
+
+
+def _tokenize(text: str) -> Tuple[str, set]:
+    """Casefold text and return it with its word tokens (plus naive singular forms)."""
+    q = text.casefold()
+    tokens = set(_TOKEN_RE.findall(q))
+    tokens.update([t[:-1] for t in tokens if len(t) > 3 and t.endswith("s")])
+    return q, tokens
+
+
+# (requires, excludes) keyword groups of each rule, compiled once
+_RULE_FILTERS = tuple(
+    (
+        _compile_keywords(requires) if requires else None,
+        _compile_keywords(excludes) if excludes else None,
+    )
+    for _keywords, _tool_name, _prepend, requires, excludes in _TOOL_KEYWORD_RULES
+)
+
+
+@functools.lru_cache(maxsize=1024)
+def _keyword_rule_hits(text: str) -> frozenset:
+    """Indices of _TOOL_KEYWORD_RULES that select their tool for text, memoized per text."""
+    q, tokens = _tokenize(text)
+    hits = set()
+    for i in _matched_rule_indices(q, tokens):
+        requires, excludes = _RULE_FILTERS[i]
+        if requires is not None and not _keywords_match(requires, q, tokens):
+            continue
+        if excludes is not None and _keywords_match(excludes, q, tokens):
+            continue
+        hits.add(i)
+    return frozenset(hits)
+
+
+def _dependency_graph(subquestions: List[Dict]) -> Tuple[Dict[int, Dict], Dict[int, int], Dict[int, List[int]]]:
+    """
+    Build (id_map, indeg, successors) for the subquestion DAG.
+    Raises ValueError on unknown dependencies or cycles.
+    """
     id_map = {sq["id"]: sq for sq in subquestions}
     indeg = {sq["id"]: 0 for sq in subquestions}
-    g = defaultdict(list)
+    g: Dict[int, List[int]] = {}
     for sq in subquestions:
         for dep in sq.get("depends_on", []) or []:
             if dep not in id_map:
                 raise ValueError(f"Invalid dependency: {dep} referenced by {sq['id']}")
-            g[dep].append(sq["id"])
+            g.setdefault(dep, []).append(sq["id"])
             indeg[sq["id"]] += 1
-    q = deque([nid for nid, d in indeg.items() if d == 0])
+    # Kahn pass on a copy, only to reject cycles before any work is dispatched
+    remaining = dict(indeg)
+    stack = [nid for nid, d in remaining.items() if d == 0]
+    count = 0
+    while stack:
+        nid = stack.pop()
+        count += 1
+        for nei in g.get(nid, ()):
+            remaining[nei] -= 1
+            if remaining[nei] == 0:
+                stack.append(nei)
+    if count != len(subquestions):
+        raise ValueError("Cycle detected or missing nodes in dependencies")
+    return id_map, indeg, g
+
+
+def topo_sort_subquestions(subquestions: List[Dict]) -> List[Dict]:
+    """Subquestions in dependency order (Kahn's algorithm over _dependency_graph)."""
+    id_map, indeg, g = _dependency_graph(subquestions)
+    indeg = dict(indeg)
+    q = deque(nid for nid, d in indeg.items() if d == 0)
     result = []
     while q:
         nid = q.popleft()
         result.append(id_map[nid])
-        for nei in g[nid]:
+        for nei in g.get(nid, ()):
             indeg[nei] -= 1
             if indeg[nei] == 0:
                 q.append(nei)
-    if len(result) != len(subquestions):
-        raise ValueError("Cycle detected or missing nodes in dependencies")
     return result
 
 
+def _scan_placeholders(text: str) -> List[str]:
+    """Placeholder keys in text, in order, from a single findall (skipped when there is no "{{")."""
+    if "{{" not in text:
+        return []
+    return PLACEHOLDER_PATTERN.findall(text)
+
+
 def extract_placeholders(text: str) -> List[str]:
-    return [m.group(1) for m in PLACEHOLDER_PATTERN.finditer(text)]
+    return _scan_placeholders(text)
+
+
+def _placeholder_value(key: str, answered_by_id: Dict[int, dict]) -> Optional[str]:
+    """Look up the value for a FIELD_FROM_Qn placeholder key, or None if it can't be resolved."""
+    m2 = _PLACEHOLDER_INNER.match(key)
+    if not m2:
+        return None
+    field_name, sid = m2.group(1), int(m2.group(2))
+    field_lower = field_name.lower()
+    ans = answered_by_id.get(sid)
+    if not ans:
+        return None
+    ed = ans.get("extracted_data") or {}
+    value = None
+    if isinstance(ed, dict):
+        value = ed.get(field_lower) or ed.get(field_name)
+    a = ans.get("answer")
+    if value is None and isinstance(a, dict):
+        v = a.get(field_lower) or a.get(field_name)
+        if v:
+            value = v
+    if value is None and isinstance(a, str):
+        txt = a.strip()
+        # try to parse trailing tokens
+        if ":" in txt:
+            parts = txt.split(":")
+            value = parts[-1].strip().split()[0]
+        else:
+            value = txt.split()[0] if txt.split() else None
+    return None if value is None else str(value)
 
 
 def resolve_placeholders(
     question_text: str, answered_by_id: Dict[int, dict]
 ) -> Tuple[str, List[str]]:
-    missing = []
+    """
+    Substitute {{FIELD_FROM_Qn}} placeholders: each distinct key is resolved once,
+    then the text is rewritten in a single pass.
+    Returns the resolved text and the placeholder keys that could not be resolved.
+    """
+    keys = _scan_placeholders(question_text)
+    if not keys:
+        return question_text, []
 
-    def repl(match):
-        key = match.group(1)  # e.g., TICKER_FROM_Q1
-        m2 = re.match(r"(.+)_FROM_Q(\d+)$", key)
-        if m2:
-            field_name, sid = m2.group(1), int(m2.group(2))
-            ans = answered_by_id.get(sid)
-            if not ans:
-                missing.append(key)
-                return match.group(0)
-            ed = ans.get("extracted_data") or {}
-            value = None
-            if isinstance(ed, dict):
-                value = ed.get(field_name.lower()) or ed.get(field_name)
-            a = ans.get("answer")
-            if value is None and isinstance(a, dict):
-                v = a.get(field_name.lower()) or a.get(field_name)
-                if v:
-                    value = v
-            if value is None and isinstance(a, str):
-                txt = a.strip()
-                # try to parse trailing tokens
-                if ":" in txt:
-                    parts = txt.split(":")
-                    value = parts[-1].strip().split()[0]
-                else:
-                    value = txt.split()[0] if txt.split() else None
-            if value is None:
-                missing.append(key)
-                return match.group(0)
-            return str(value)
-        else:
+    values: Dict[str, str] = {}
+    missing = []
+    for key in dict.fromkeys(keys):  # e.g., TICKER_FROM_Q1
+        value = _placeholder_value(key, answered_by_id)
+        if value is None:
             missing.append(key)
-            return match.group(0)
+        else:
+            values[key] = value
+    if not values:
+        return question_text, missing
 
-    resolved = PLACEHOLDER_PATTERN.sub(repl, question_text)
+    resolved = PLACEHOLDER_PATTERN.sub(lambda m: values.get(m.group(1), m.group(0)), question_text)
     return resolved, missing
 
 
@@ -108,19 +372,19 @@ def _try_parse_arguments(arg_blob: Any) -> Dict[str, Any]:
         s = arg_blob.strip()
         # strip surrounding code fences/backticks
         if s.startswith("```"):
-            s = re.sub(r"^```[a-zA-Z0-9]*\n?", "", s)
-            s = re.sub(r"```$", "", s)
+            s = _FENCE_OPEN_RE.sub("", s)
+            s = _FENCE_CLOSE_RE.sub("", s)
             s = s.strip()
         # try parsing
         try:
-            parsed = json.loads(s)
+            parsed = json_loads(s)
             if isinstance(parsed, dict):
                 return parsed
         except Exception:
             # try simple key=value pairs fallback
             try:
                 # naive parse: key1=val1,key2=val2
-                parts = re.split(r"[,;\n]", s)
+                parts = _KV_SPLIT_RE.split(s)
                 out = {}
                 for p in parts:
                     if "=" in p:
@@ -133,73 +397,79 @@ def _try_parse_arguments(arg_blob: Any) -> Dict[str, Any]:
     return {}
 
 
+# Common argument aliases produced by the LLM -> canonical parameter name
+_ALIAS_MAP = {
+    # ticker aliases
+    "ticker_symbol": "ticker",
+    "stock_ticker": "ticker",
+    "stock_symbol": "ticker",
+    "symbol": "ticker",
+    "ticker": "ticker",
+    # company aliases
+    "company_name": "company_name",
+    "company": "company_name",
+    "name": "company_name",
+    # country aliases
+    "country": "country",
+    "country_code": "country_code",
+    "country_name": "country",
+    # indicator/metric aliases
+    "indicator": "indicator",
+    "metric": "indicator",
+    # generic
+    "query": "query",
+    "q": "query",
+    "start_date": "start_date",
+    "end_date": "end_date",
+    "date": "date",
+    "period": "period",
+    "exchange": "exchange",
+    "from_currency": "from_currency",
+    "to_currency": "to_currency",
+    "amount": "amount",
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _param_info(func: Callable) -> Tuple[Tuple[str, ...], frozenset, Dict[str, str]]:
+    """Keyword-capable parameter names of func, as (names, name set, lowercase -> name)."""
+    sig = inspect.signature(func)
+    names = tuple(
+        pname for pname, p in sig.parameters.items()
+        if p.kind in (inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY)
+    )
+    return names, frozenset(names), {n.lower(): n for n in names}
+
+
 def _map_aliases_to_signature(args: Dict[str, Any], func: Callable) -> Dict[str, Any]:
     """
     Given raw args (possibly containing aliases like ticker_symbol), map them to real
     parameter names from func signature when possible.
-    Strategy:
-      - inspect signature param names
-      - define common alias mapping heuristics
-      - if an alias key matches, map to the canonical param name
-      - drop unknown keys (but keep them if they match)
+    Strategy (each key is resolved with O(1) lookups):
+      - exact parameter name
+      - _ALIAS_MAP entry (keys are lowercase) whose target is a parameter
+      - case-insensitive parameter name
+      - otherwise the key is dropped
     """
-    sig = inspect.signature(func)
-    param_names = [pname for pname in sig.parameters.keys() if sig.parameters[pname].kind in (inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY)]
-    # build simple alias rules
-    alias_map = {
-        # ticker aliases
-        "ticker_symbol": "ticker",
-        "stock_ticker": "ticker",
-        "stock_symbol": "ticker",
-        "symbol": "ticker",
-        "ticker": "ticker",
-        # company aliases
-        "company_name": "company_name",
-        "company": "company_name",
-        "name": "company_name",
-        # country aliases
-        "country": "country",
-        "country_code": "country_code",
-        "country_name": "country",
-        # indicator/metric aliases
-        "indicator": "indicator",
-        "metric": "indicator",
-        # generic
-        "query": "query",
-        "q": "query",
-        "start_date": "start_date",
-        "end_date": "end_date",
-        "date": "date",
-        "period": "period",
-        "exchange": "exchange",
-        "from_currency": "from_currency",
-        "to_currency": "to_currency",
-        "amount": "amount",
-    }
+    param_names, param_set, param_by_lower = _param_info(func)
     mapped: Dict[str, Any] = {}
     # first, copy direct matches
     for k, v in args.items():
-        if k in param_names:
+        if k in param_set:
             mapped[k] = v
     # then aliases
     for k, v in args.items():
         if k in mapped:
             continue
         lower = k.lower()
-        if lower in alias_map and alias_map[lower] in param_names:
-            mapped[alias_map[lower]] = v
+        target = _ALIAS_MAP.get(lower)
+        if target in param_set:
+            mapped[target] = v
             continue
-        # try fuzzy: find param that contains token
-        for p in param_names:
-            if lower == p.lower():
-                mapped[p] = v
-                break
-        else:
-            # try mapping common patterns: e.g. "tickerSymbol" -> ticker
-            for alias_k, target in alias_map.items():
-                if alias_k.lower() == lower and target in param_names:
-                    mapped[target] = v
-                    break
+        # try fuzzy: case-insensitive match on the param name
+        p = param_by_lower.get(lower)
+        if p is not None:
+            mapped[p] = v
     # finally, if mapped empty but func expects a single param, try to place value there
     if not mapped and param_names and len(param_names) == 1:
         mapped[param_names[0]] = next(iter(args.values()))
@@ -219,15 +489,43 @@ class FinancialAgent:
             self._build_tool_index()
         
         # Conversation history for this agent instance
-        self.conversation_history: List[Dict[str, str]] = []
+        self.conversation_history: Deque[Dict[str, Any]] = deque(maxlen=MAX_HISTORY_EXCHANGES)
         
         # Callback for tool execution events
         self.tool_callback = None
+
+        # Snapshot of the registry by tool name, plus the keyword heuristics for
+        # _search_tools resolved against it; both are rebuilt if the registry grows
+        self._tools: Dict[str, ToolMeta] = {}
+        self._kw_rules: List[Tuple] = []
+        self._sync_tools()
+
+    def _sync_tools(self) -> None:
+        """Re-snapshot the registry if tools were registered since the last snapshot."""
+        if len(self._tools) != len(self.registry.list_tools()):
+            self._tools = dict(self.registry.list_tools())
+            self._kw_rules = self._build_keyword_rules()
+
+    def _get_cached(self, name: str) -> Optional[ToolMeta]:
+        """Look up a tool by name in the registry snapshot."""
+        self._sync_tools()
+        return self._tools.get(name)
+
+    def _build_keyword_rules(self) -> List[Tuple[int, ToolMeta, bool]]:
+        """Resolve _TOOL_KEYWORD_RULES into (rule index, tool meta, prepend) for registered tools."""
+        rules = []
+        for i, (_keywords, tool_name, prepend, _requires, _excludes) in enumerate(_TOOL_KEYWORD_RULES):
+            meta = self._tools.get(tool_name)
+            if meta:
+                rules.append((i, meta, prepend))
+        return rules
     
     def _build_tool_index(self):
         """Build tool index on demand"""
         if self._tool_index is None:
             try:
+                # Deferred: pulls in langchain, FAISS and the embedding model
+                from .vector_index import build_tool_vector_index_from_registry
                 self._tool_index = build_tool_vector_index_from_registry(self.registry)
             except Exception as e:
                 logger.warning("Failed to build tool vector index: %s. Continuing without index.", e)
@@ -245,236 +543,176 @@ class FinancialAgent:
         if raw is None:
             return ""
         cleaned = raw.strip()
-        if cleaned.startswith("```"):
-            cleaned = re.sub(r"^```[a-zA-Z0-9]*\n?", "", cleaned)
-            cleaned = re.sub(r"```$", "", cleaned)
+        if not cleaned.startswith("```"):
+            return cleaned
+        cleaned = _FENCE_OPEN_RE.sub("", cleaned)
+        cleaned = _FENCE_CLOSE_RE.sub("", cleaned)
         return cleaned.strip()
 
-    def generate_subquestions_from_query(self, user_query: str) -> List[SubQuestion]:
+    def _subquestion_generation_msgs(self, user_query: str) -> List[Dict[str, str]]:
+        # Prompt pieces are collected and joined once
+        parts = [GENERATE_SUBQUESTION_SYSTEM_PROMPT_TEMPLATE]
         # Build context from conversation history
-        context_str = ""
         if self.conversation_history:
-            context_str = "\n\nConversation context (previous exchanges):\n"
-            for i, exchange in enumerate(self.conversation_history[-3:], 1):  # Last 3 exchanges
-                context_str += f"\nExchange {i}:\n"
-                context_str += f"User: {exchange['user_query']}\n"
-                context_str += f"Assistant: {exchange['assistant_response'][:200]}...\n"  # Truncate for brevity
-        
-        prompt = (
-            GENERATE_SUBQUESTION_SYSTEM_PROMPT_TEMPLATE
-            + context_str
-            + f"\n\nCurrent user query:\n{user_query}\n"
-        )
+            parts.append("\n\nConversation context (previous exchanges):\n")
+            for i, exchange in enumerate(self._recent_exchanges(3), 1):  # Last 3 exchanges
+                parts.append(
+                    f"\nExchange {i}:\n"
+                    f"User: {exchange['user_query']}\n"
+                    f"Assistant: {exchange['assistant_response'][:200]}...\n"  # Truncate for brevity
+                )
+        parts.append(f"\n\nCurrent user query:\n{user_query}\n")
+        prompt = "".join(parts)
         msgs = [
             {"role": "system", "content": GENERATE_SUBQUESTION_SYSTEM_PROMPT_TEMPLATE},
             {"role": "user", "content": prompt},
         ]
-        out = self.gemini.generate(msgs, tools=None, use_history=False, save_to_history=False)
-        raw_text = out.get("text") or "[]"
-        cleaned = self._clean_json_str(raw_text)
+        return msgs
+
+    def _parse_subquestions(
+        self, raw_text: Optional[str], user_query: str, parsed: Any = None
+    ) -> Tuple[List[SubQuestion], bool]:
+        """Parse the planner output; returns (subquestions, parsed_ok).
+
+        parsed is the wrapper's already-decoded structured reply, used as-is when it's an object.
+        """
+        raw_text = raw_text or "[]"
         try:
-            j = json.loads(cleaned)
+            j = parsed if isinstance(parsed, dict) else json_loads(self._clean_json_str(raw_text))
             subs = j.get("subquestions", [])
-            return [SubQuestion(**s) for s in subs]
+            return [SubQuestion(**s) for s in subs], True
         except Exception as e:
             logger.warning("Failed to parse subquestions JSON: %s. Raw was: %s", e, raw_text)
             # fallback: single subquestion
-            return [SubQuestion(id=1, question=user_query, depends_on=[])]
+            return [SubQuestion(id=1, question=user_query, depends_on=[])], False
 
-    def _search_tools(self, resolved_subquestion: str, answered_subquestions: List[dict]) -> List:
-        tools = []
-        
-        if self.tool_index is None:
-            logger.warning("Tool index not available, falling back to heuristic search only")
-        else:
-            hits = self.tool_index.similarity_search(resolved_subquestion, k=4)
-            for doc in hits:
-                name = doc.metadata.get("tool_name")
-                meta = self.registry.get(name)
-                if meta:
-                    tools.append(meta.func)
+    def _subquestion_cache_key(self, user_query: str) -> Optional[str]:
+        # With history the plan depends on earlier exchanges, so only context-free plans are cached
+        if self.conversation_history:
+            return None
+        return _answer_cache_key(user_query, getattr(self.gemini, "model", self.gemini.model_name))
 
-        q = resolved_subquestion.lower()
+    def _answer_key(self, user_query: str, token: Optional[str]) -> Optional[str]:
+        # Follow-ups are answered in the context of earlier exchanges, so only context-free answers are cached
+        if self.conversation_history:
+            return None
+        return _answer_cache_key(user_query, token, getattr(self.gemini, "model", self.gemini.model_name))
 
-        # ========== Enhanced Heuristic Rules ==========
-        
-        # Stock symbol lookup
-        if "mã cổ phiếu" in q or "ticker" in q or "symbol" in q or "mã chứng khoán" in q:
-            sym = self.registry.get("get_stock_symbol")
-            if sym and sym.func not in tools:
-                tools.insert(0, sym.func)
-
-        # Sector/Industry classification
-        if "ngành" in q or "sector" in q or "industry" in q or "lĩnh vực" in q or "thuộc ngành" in q:
-            sector = self.registry.get("get_sector_mapping")
-            if sector and sector.func not in tools:
-                tools.insert(0, sector.func)
-
-        # Macro economic data
-        if any(word in q for word in ["lạm phát", "inflation", "cpi", "gdp", "thất nghiệp", "unemployment", 
-                                       "lãi suất", "interest rate", "vĩ mô", "macro", "kinh tế vĩ mô"]):
-            macro = self.registry.get("get_macro_data")
-            if macro and macro.func not in tools:
-                tools.insert(0, macro.func)
-
-        # Exchange information
-        if "sàn" in q or "exchange" in q or ("hose" in q or "hnx" in q or "upcom" in q):
-            exchange = self.registry.get("get_exchange_info")
-            if exchange and exchange.func not in tools:
-                tools.insert(0, exchange.func)
-
-        # Currency exchange rate
-        if any(word in q for word in ["tỷ giá", "exchange rate", "usd", "vnd", "currency", "đô la", "đồng"]):
-            currency = self.registry.get("get_currency_rate")
-            if currency and currency.func not in tools:
-                tools.insert(0, currency.func)
-
-        # Income statement / Revenue
-        if any(word in q for word in ["doanh thu", "revenue", "lợi nhuận", "profit", "earnings", "income statement", 
-                                       "kết quả kinh doanh", "ebitda", "net income"]):
-            income = self.registry.get("get_income_statement")
-            if income and income.func not in tools:
-                tools.insert(0, income.func)
-
-        # Balance sheet / Equity / Assets
-        if any(word in q for word in ["vốn chủ", "equity", "tài sản", "assets", "nợ", "debt", "liabilities", 
-                                       "bảng cân đối", "balance sheet", "shareholders equity", "total assets"]):
-            balance = self.registry.get("get_balance_sheet")
-            if balance and balance.func not in tools:
-                tools.insert(0, balance.func)
-
-        # Cash flow analysis
-        if any(word in q for word in ["dòng tiền", "cash flow", "operating cash", "free cash flow", "fcf", 
-                                       "investing cash", "financing cash"]):
-            cashflow = self.registry.get("analyze_cashflow")
-            if cashflow and cashflow.func not in tools:
-                tools.insert(0, cashflow.func)
-
-        # Financial ratios
-        if any(word in q for word in ["roe", "roa", "pe", "p/e", "pb", "p/b", "eps", "tỷ số", "chỉ số tài chính",
-                                       "tỷ lệ", "margin", "biên lợi nhuận"]):
-            ratios = self.registry.get("calculate_ratios")
-            if ratios and ratios.func not in tools:
-                tools.insert(0, ratios.func)
-
-        # Valuation / Fair value
-        if any(word in q for word in ["định giá", "valuation", "fair value", "giá trị hợp lý", "dcf", "ddm", "peg"]):
-            valuation = self.registry.get("estimate_fair_value")
-            if valuation and valuation.func not in tools:
-                tools.insert(0, valuation.func)
-
-        # Technical indicators
-        if any(word in q for word in ["rsi", "macd", "ma", "moving average", "bollinger", "technical", 
-                                       "chỉ báo kỹ thuật", "đường trung bình"]):
-            technical = self.registry.get("get_technical_indicators")
-            if technical and technical.func not in tools:
-                tools.insert(0, technical.func)
-
-        # Chart / Graph / Visualization
-        if any(word in q for word in ["biểu đồ", "chart", "graph", "vẽ", "draw", "plot", "visualize", 
-                                       "biến động giá", "price movement", "price chart", "lịch sử giá"]):
-            chart = self.registry.get("generate_stock_price_chart")
-            if chart and chart.func not in tools:
-                tools.insert(0, chart.func)
-        
-        # Price / Stock price
-        if any(word in q for word in ["giá", "price", "stock price", "giá cổ phiếu", "thị giá"]):
-            price = self.registry.get("get_stock_price")
-            if price and price.func not in tools:
-                tools.insert(0, price.func)
-
-        # Fundamental analysis
-        if "thông tin cơ bản" in q or "fundamental" in q or "profile" in q:
-            fund = self.registry.get("get_fundamentals")
-            if fund and fund.func not in tools:
-                tools.insert(0, fund.func)
-
-        # Risk metrics
-        if any(word in q for word in ["risk", "volatility", "beta", "sharpe", "sortino", "drawdown", "var", 
-                                       "rủi ro", "biến động"]):
-            risk = self.registry.get("get_risk_metrics")
-            if risk and risk.func not in tools:
-                tools.insert(0, risk.func)
-
-        # ========== PFM Tools Heuristics ==========
-        
-        # PFM: Expense
-        if any(word in q for word in ["chi tiêu", "expense", "spending", "cost", "mua", "trả tiền", "tốn", "spend", "chi"]):
-            # Check if it's adding or searching
-            if any(w in q for w in ["thêm", "add", "new", "tạo", "ghi", "vừa"]):
-                tool = self.registry.get("pfm_add_expense")
-                if tool and tool.func not in tools:
-                    tools.insert(0, tool.func)
-            # Also add search if not explicitly adding, or as fallback
-            tool = self.registry.get("pfm_search_expenses")
-            if tool and tool.func not in tools:
-                tools.append(tool.func)
-                
-        # PFM: Income
-        if any(word in q for word in ["thu nhập", "income", "lương", "salary", "bonus", "thưởng", "kiếm được", "nhận được"]):
-            if any(w in q for w in ["thêm", "add", "new", "tạo", "ghi", "vừa"]):
-                tool = self.registry.get("pfm_add_income")
-                if tool and tool.func not in tools:
-                    tools.insert(0, tool.func)
-            tool = self.registry.get("pfm_search_incomes")
-            if tool and tool.func not in tools:
-                tools.append(tool.func)
-
-        # PFM: Dashboard/Summary
-        if any(word in q for word in ["tài chính", "financial", "balance", "số dư", "tổng kết", "summary", "báo cáo", "report", "tiền"]):
-            tool = self.registry.get("pfm_get_financial_summary")
-            if tool and tool.func not in tools:
-                tools.insert(0, tool.func)
-            tool = self.registry.get("pfm_get_report_by_time")
-            if tool and tool.func not in tools:
-                tools.append(tool.func)
-
-        # PFM: Watchlist
-        if any(word in q for word in ["watchlist", "theo dõi", "track", "quan tâm", "danh sách"]):
-            if any(w in q for w in ["thêm", "add", "new"]):
-                tool = self.registry.get("pfm_add_to_watchlist")
-                if tool and tool.func not in tools:
-                    tools.insert(0, tool.func)
-            elif any(w in q for w in ["xóa", "remove", "delete", "bỏ"]):
-                tool = self.registry.get("pfm_remove_from_watchlist")
-                if tool and tool.func not in tools:
-                    tools.insert(0, tool.func)
-            
-            tool = self.registry.get("pfm_get_watchlist")
-            if tool and tool.func not in tools:
-                tools.append(tool.func)
+    def _cached_subquestions(self, cache_key: Optional[str]) -> Optional[List[SubQuestion]]:
+        if cache_key is None:
+            return None
+        cached = _SUBQUESTION_CACHE.get(cache_key)
+        if cached is None:
+            return None
+        return [s.copy(deep=True) for s in cached]
+
+    def _store_subquestions(self, cache_key: Optional[str], subs: List[SubQuestion], parsed_ok: bool) -> List[SubQuestion]:
+        # Don't pin the single-question fallback for a whole TTL after one bad LLM reply
+        if cache_key is not None and parsed_ok:
+            _SUBQUESTION_CACHE.set(cache_key, [s.copy(deep=True) for s in subs])
+        return subs
+
+    def generate_subquestions_from_query(self, user_query: str) -> List[SubQuestion]:
+        cache_key = self._subquestion_cache_key(user_query)
+        cached = self._cached_subquestions(cache_key)
+        if cached is not None:
+            return cached
+        msgs = self._subquestion_generation_msgs(user_query)
+        out = self.gemini.generate(
+            msgs, tools=None, use_history=False, save_to_history=False,
+            response_schema=SUBQUESTION_RESPONSE_SCHEMA,
+        )
+        subs, parsed_ok = self._parse_subquestions(out.get("text"), user_query, out.get("json"))
+        return self._store_subquestions(cache_key, subs, parsed_ok)
+
+    async def agenerate_subquestions_from_query(self, user_query: str) -> List[SubQuestion]:
+        cache_key = self._subquestion_cache_key(user_query)
+        cached = self._cached_subquestions(cache_key)
+        if cached is not None:
+            return cached
+        msgs = self._subquestion_generation_msgs(user_query)
+        out = await self.gemini.agenerate(
+            msgs, tools=None, use_history=False, save_to_history=False,
+            response_schema=SUBQUESTION_RESPONSE_SCHEMA,
+        )
+        subs, parsed_ok = self._parse_subquestions(out.get("text"), user_query, out.get("json"))
+        return self._store_subquestions(cache_key, subs, parsed_ok)
 
-        return tools
+    def _search_tools(self, resolved_subquestion: str, tool_hits: Optional[List[str]] = None) -> List:
+        """
+        Candidate tools for a subquestion: vector-search hits (tool_hits if already computed
+        by a batched search) followed by the keyword heuristics.
+        """
+        # deque for O(1) prepends; seen for O(1) de-duplication
+        tools: deque = deque()
+        seen = set()
+        self._sync_tools()
+        tool_by_name = self._tools
+
+        if tool_hits is None:
+            if self.tool_index is None:
+                logger.warning("Tool index not available, falling back to heuristic search only")
+                tool_hits = ()
+            else:
+                docs = self.tool_index.similarity_search(resolved_subquestion, k=4)
+                tool_hits = [doc.metadata.get("tool_name") for doc in docs]
+        for name in tool_hits:
+            meta = tool_by_name.get(name)
+            if meta and meta.func not in seen:
+                seen.add(meta.func)
+                tools.append(meta.func)
+
+        hits = _keyword_rule_hits(resolved_subquestion.casefold())
+
+        for i, meta, prepend in self._kw_rules:
+            if i not in hits:
+                continue
+            # Resolving func imports the tool module, so only do it for rules that matched
+            func = meta.func
+            if func in seen:
+                continue
+            seen.add(func)
+            if prepend:
+                tools.appendleft(func)
+            else:
+                tools.append(func)
+
+        return list(tools)
 
 
     def _call_callable(self, func: Callable, args: Dict[str, Any], token: Optional[str] = None):
         # Inject token if the function expects it
-        sig = inspect.signature(func)
-        if "token" in sig.parameters and token:
+        if token and "token" in _param_info(func)[1]:
             args["token"] = token
             
         # call function with mapped args
         return func(**(args or {}))
 
     def _subquestion_prompt_msgs(
-        self, id: int, resolved_question: str, dependencies: List[dict], user_query: str
+        self, id: int, resolved_question: str, dependencies: List[dict], user_query: str,
+        now_iso: Optional[str] = None,
     ):
-        dep_str = json.dumps(dependencies, ensure_ascii=False, default=str)
+        dep_str = json_dumps(dependencies, default=str)
         
         # Add conversation context
         context_str = ""
         if self.conversation_history:
-            context_str = "\n\nConversation context (recent history):\n"
-            for i, exchange in enumerate(self.conversation_history[-2:], 1):  # Last 2 exchanges
-                context_str += f"Q{i}: {exchange['user_query']}\n"
-                context_str += f"A{i}: {exchange['assistant_response'][:150]}...\n"
+            context_str = "\n\nConversation context (recent history):\n" + "".join(
+                f"Q{i}: {exchange['user_query']}\n"
+                f"A{i}: {exchange['assistant_response'][:150]}...\n"
+                for i, exchange in enumerate(self._recent_exchanges(2), 1)  # Last 2 exchanges
+            )
         
-        content = SUBQUESTION_ANSWER_PROMPT
-        content = content.replace("{current_datetime}", datetime.datetime.utcnow().isoformat())
-        content = content.replace("{id}", str(id))
-        content = content.replace("{subquestion}", resolved_question)
-        content = content.replace("{dependencies}", dep_str)
-        content = content.replace("{user_query}", user_query)
+        if now_iso is None:
+            now_iso = _utc_now_iso()
+        # Template is pre-split at import; substituted values are not rescanned for fields
+        content = render_subq_prompt(
+            current_datetime=now_iso,
+            id=id,
+            subquestion=resolved_question,
+            dependencies=dep_str,
+            user_query=user_query,
+        )
         content += context_str
         
         msgs = [
@@ -483,188 +721,476 @@ class FinancialAgent:
         ]
         return msgs
 
-    def answer(self, user_query: str, token: Optional[str] = None) -> dict:
-        subs = self.generate_subquestions_from_query(user_query)
-        subs_raw = [s.dict() for s in subs]
-        ordered = topo_sort_subquestions(subs_raw)
-        answered_by_id: Dict[int, dict] = {}
-
-        for sq in ordered:
-            sq_id = sq["id"]
-            deps = [answered_by_id[d] for d in (sq.get("depends_on") or []) if d in answered_by_id]
-            resolved_text, missing = resolve_placeholders(sq["question"], answered_by_id)
-            if missing:
-                ans_obj = {
-                    "id": sq_id,
-                    "answer": f"SKIP: missing placeholders {missing}",
-                    "used_tools": [],
-                    "extracted_data": {},
-                }
-                answered_by_id[sq_id] = ans_obj
-                continue
+    @staticmethod
+    def _answer_obj(sq_id: int, answer: Any, used_tools: Optional[List[str]] = None,
+                    extracted_data: Optional[dict] = None) -> dict:
+        return {
+            "id": sq_id,
+            "answer": answer,
+            "used_tools": used_tools or [],
+            "extracted_data": extracted_data if extracted_data is not None else {},
+        }
 
-            tools = self._search_tools(resolved_text, list(answered_by_id.values()))
-            msgs = self._subquestion_prompt_msgs(sq_id, resolved_text, deps, user_query)
+    def _prepare_subquestion(
+        self, sq: dict, answered_by_id: Dict[int, dict], user_query: str, now_iso: Optional[str] = None,
+        tool_hits: Optional[List[str]] = None,
+    ) -> Tuple[Optional[dict], str, List, List[Dict[str, str]]]:
+        """
+        Phase 1 of answering a subquestion: resolve placeholders, route tools and build the prompt.
+        Returns (skip answer or None, resolved text, candidate tools, prompt messages).
+        """
+        deps = [answered_by_id[d] for d in (sq.get("depends_on") or []) if d in answered_by_id]
+        resolved_text, missing = resolve_placeholders(sq["question"], answered_by_id)
+        if missing:
+            return self._answer_obj(sq["id"], f"SKIP: missing placeholders {missing}"), resolved_text, [], []
 
-            # if no tool appropriate, ask LLM normally
-            if not tools:
-                out = self.gemini.generate(msgs, tools=None, use_history=False, save_to_history=False)
-                ans_text = out.get("text") or ""
-                ans_obj = {"id": sq_id, "answer": ans_text, "used_tools": [], "extracted_data": {}}
-                answered_by_id[sq_id] = ans_obj
-                continue
+        tools = self._search_tools(resolved_text, tool_hits)
+        msgs = self._subquestion_prompt_msgs(sq["id"], resolved_text, deps, user_query, now_iso)
+        return None, resolved_text, tools, msgs
 
-            # --- ask LLM with tool metadata (tools passed to wrapper may be used in function_call detection) ---
-            out = self.gemini.generate(msgs, tools=tools, function_call="auto", use_history=False, save_to_history=False)
-            raw_text = out.get("text")
-            fc = out.get("function_call")
+    def _parse_function_call(self, out: dict) -> Tuple[Optional[dict], Optional[str]]:
+        """Extract the function_call directive from an LLM reply, including one embedded as JSON text."""
+        raw_text = out.get("text")
+        fc = out.get("function_call")
 
-            # if LLM embedded function_call in text as JSON, try to parse it
-            if not fc and raw_text:
-                cleaned = self._clean_json_str(raw_text)
+        # if LLM embedded function_call in text as JSON, try to parse it;
+        # plain prose answers are the common case, so only attempt it on a JSON object
+        if not fc and raw_text:
+            cleaned = self._clean_json_str(raw_text)
+            if cleaned.startswith("{"):
                 try:
-                    parsed = json.loads(cleaned)
-                    if isinstance(parsed, dict) and "function_call" in parsed:
+                    parsed = json_loads(cleaned)
+                except Exception:
+                    parsed = None
+                if isinstance(parsed, dict):
+                    if "function_call" in parsed:
                         fc = parsed["function_call"]
                         logger.debug("Parsed function_call from text JSON: %s", fc)
-                except Exception:
-                    # sometimes LLM returns bare function call dict w/o wrapper; attempt to detect
-                    try:
-                        parsed2 = json.loads(cleaned)
-                        if isinstance(parsed2, dict) and "name" in parsed2 and "arguments" in parsed2:
-                            fc = parsed2
-                            logger.debug("Parsed direct function_call-like dict from text: %s", fc)
-                    except Exception:
-                        pass
-
-            # If we have a function_call directive, execute the tool
-            if fc:
-                fname = fc.get("name")
-                fargs_raw = fc.get("arguments") or {}
-                # fargs may be stringified JSON
-                if isinstance(fargs_raw, str):
-                    fargs = _try_parse_arguments(fargs_raw)
+                    elif "name" in parsed and "arguments" in parsed:
+                        # sometimes LLM returns bare function call dict w/o wrapper
+                        fc = parsed
+                        logger.debug("Parsed direct function_call-like dict from text: %s", fc)
+        return fc, raw_text
+
+    def _resolve_tool_call(self, fc: dict, tools: List) -> Tuple[Optional[Callable], str, Dict[str, Any]]:
+        """Map a function_call directive to (tool func, tool name, arguments mapped to its signature)."""
+        fname = fc.get("name")
+        fargs_raw = fc.get("arguments") or {}
+        # fargs may be stringified JSON
+        if isinstance(fargs_raw, str):
+            fargs = _try_parse_arguments(fargs_raw)
+        else:
+            fargs = dict(fargs_raw)
+
+        # locate tool in registry
+        meta = self._get_cached(fname) if fname else None
+        # if not found by name, try to pick first tool from 'tools' list
+        chosen_func = meta.func if meta else (tools[0] if tools else None)
+        chosen_name = meta.name if meta else (getattr(chosen_func, "__name__", "unknown") if chosen_func else "unknown")
+
+        # map aliases to real signature names
+        try:
+            mapped_args = _map_aliases_to_signature(fargs, chosen_func) if chosen_func else fargs
+        except Exception as e:
+            logger.debug("Failed to map args for %s: %s. Using raw args.", fname or "unknown", e)
+            mapped_args = fargs
+
+        logger.info("Calling tool %s with args %s (raw=%s)", chosen_name, mapped_args, fargs_raw)
+        return chosen_func, chosen_name, mapped_args
+
+    def _run_tool(
+        self, func: Callable, name: str, args: Dict[str, Any], resolved_text: str, token: Optional[str] = None,
+    ) -> dict:
+        """Execute a tool, reporting start/completion through tool_callback. Raises on tool errors."""
+        # Trigger tool callback if set
+        if self.tool_callback:
+            self.tool_callback({
+                "type": "tool_start",
+                "tool_name": name,
+                "question": resolved_text,
+                "args": args
+            })
+
+        result = self._call_callable(func, args, token=token)
+        extracted = result if isinstance(result, dict) else {"result": result}
+
+        # Trigger tool completion callback
+        if self.tool_callback:
+            self.tool_callback({
+                "type": "tool_complete",
+                "tool_name": name,
+                "result": extracted
+            })
+        return extracted
+
+    @staticmethod
+    def _tool_followup_msgs(msgs: List[Dict[str, str]], name: str, extracted: dict) -> List[Dict[str, str]]:
+        # give the LLM the tool output for finalization / commentary
+        return msgs + [
+            {
+                "role": "assistant",
+                "content": f"Tool {name} returned: {json_dumps(extracted, default=str)}",
+            }
+        ]
+
+    def _answer_one_subquestion(
+        self, sq: dict, answered_by_id: Dict[int, dict], user_query: str,
+        token: Optional[str] = None, now_iso: Optional[str] = None, tool_hits: Optional[List[str]] = None,
+    ) -> dict:
+        """Resolve, route and answer a single subquestion given the answers it may depend on."""
+        skipped, resolved_text, tools, msgs = self._prepare_subquestion(
+            sq, answered_by_id, user_query, now_iso, tool_hits
+        )
+        if skipped:
+            return skipped
+
+        # ask LLM with tool metadata (tools passed to wrapper may be used in function_call detection)
+        out = self.gemini.generate(msgs, tools=tools or None, use_history=False, save_to_history=False)
+        return self._finish_subquestion(sq["id"], resolved_text, tools, msgs, out, token)
+
+    def _first_pass_batch(
+        self, sqs: List[dict], answered_by_id: Dict[int, dict], user_query: str,
+        now_iso: Optional[str] = None, hits_list: Optional[List[Optional[List[str]]]] = None,
+    ) -> List[Tuple[Optional[dict], str, List, List[Dict[str, str]], Optional[dict]]]:
+        """
+        Prepare subquestions that became ready together and send their first LLM calls as one
+        batched request. Returns (skip answer or None, resolved text, tools, msgs, reply) per
+        subquestion, in order; the reply is None for skipped ones.
+        """
+        hits_list = hits_list or [None] * len(sqs)
+        prepared = [
+            self._prepare_subquestion(sq, answered_by_id, user_query, now_iso, hits)
+            for sq, hits in zip(sqs, hits_list)
+        ]
+        live = [p for p in prepared if not p[0]]
+        replies = iter(self.gemini.batch_generate([p[3] for p in live], tools=[p[2] or None for p in live]))
+        return [(*p, None if p[0] else next(replies)) for p in prepared]
+
+    def _finish_subquestion(
+        self, sq_id: int, resolved_text: str, tools: List, msgs: List[Dict[str, str]], out: dict,
+        token: Optional[str] = None,
+    ) -> dict:
+        """Turn the first LLM reply into an answer, running the requested tool and a follow-up call if any."""
+        # if no tool appropriate, the LLM answered normally
+        if not tools:
+            return self._answer_obj(sq_id, out.get("text") or "")
+
+        fc, raw_text = self._parse_function_call(out)
+        if not fc:
+            # no function call from LLM - store raw_text as answer
+            return self._answer_obj(sq_id, raw_text)
+
+        func, name, args = self._resolve_tool_call(fc, tools)
+        try:
+            extracted = self._run_tool(func, name, args, resolved_text, token)
+            out2 = self.gemini.generate(
+                self._tool_followup_msgs(msgs, name, extracted), tools=None, use_history=False, save_to_history=False
+            )
+            return self._answer_obj(sq_id, out2.get("text") or str(extracted), [name], extracted)
+        except Exception as e:
+            logger.exception("Tool execution error for %s: %s", name, e)
+            return self._answer_obj(sq_id, f"ERROR executing tool {name}: {e}", [name])
+
+    async def _aanswer_one_subquestion(
+        self, sq: dict, answered_by_id: Dict[int, dict], user_query: str,
+        token: Optional[str] = None, now_iso: Optional[str] = None, tool_hits: Optional[List[str]] = None,
+    ) -> dict:
+        """
+        Async counterpart of _answer_one_subquestion. LLM calls are awaited on the event loop
+        and only routing and tool IO go to worker threads, so while one subquestion waits on
+        its tool or follow-up call, the first-pass calls of other subquestions proceed.
+        """
+        skipped, resolved_text, tools, msgs = await asyncio.to_thread(
+            self._prepare_subquestion, sq, answered_by_id, user_query, now_iso, tool_hits
+        )
+        if skipped:
+            return skipped
+
+        out = await self.gemini.agenerate(msgs, tools=tools or None, use_history=False, save_to_history=False)
+        return await self._afinish_subquestion(sq["id"], resolved_text, tools, msgs, out, token)
+
+    async def _afinish_subquestion(
+        self, sq_id: int, resolved_text: str, tools: List, msgs: List[Dict[str, str]], out: dict,
+        token: Optional[str] = None,
+    ) -> dict:
+        """Async counterpart of _finish_subquestion."""
+        if not tools:
+            return self._answer_obj(sq_id, out.get("text") or "")
+
+        fc, raw_text = self._parse_function_call(out)
+        if not fc:
+            return self._answer_obj(sq_id, raw_text)
+
+        func, name, args = self._resolve_tool_call(fc, tools)
+        try:
+            extracted = await asyncio.to_thread(self._run_tool, func, name, args, resolved_text, token)
+            out2 = await self.gemini.agenerate(
+                self._tool_followup_msgs(msgs, name, extracted), tools=None, use_history=False, save_to_history=False
+            )
+            return self._answer_obj(sq_id, out2.get("text") or str(extracted), [name], extracted)
+        except Exception as e:
+            logger.exception("Tool execution error for %s: %s", name, e)
+            return self._answer_obj(sq_id, f"ERROR executing tool {name}: {e}", [name])
+
+    def _batched_tool_search(self, texts: List[str]) -> List[Optional[List[str]]]:
+        """
+        Vector-search candidate tool names for several subquestions with one embedding call.
+        Entries are None when the index is unavailable or the batch fails, in which case
+        _search_tools falls back to its own per-subquestion search.
+        """
+        index = self.tool_index
+        if index is None or not texts:
+            return [None] * len(texts)
+        try:
+            vectors = index.embeddings.embed_documents(texts)
+            return [
+                [doc.metadata.get("tool_name") for doc in index.similarity_search_by_vector(vec, k=4)]
+                for vec in vectors
+            ]
+        except Exception as e:
+            logger.debug("Batched tool search failed, searching per subquestion: %s", e)
+            return [None] * len(texts)
+
+    def _ready_tool_hits(self, nids: List[int], id_map: Dict[int, dict], answered: Dict[int, dict]):
+        texts = [resolve_placeholders(id_map[nid]["question"], answered)[0] for nid in nids]
+        return self._batched_tool_search(texts)
+
+    def _run_subquestions(
+        self, subs_raw: List[dict], user_query: str, token: Optional[str], now_iso: str,
+    ) -> Dict[int, dict]:
+        """
+        Answer the subquestion DAG on a thread pool. A subquestion is dispatched as soon
+        as all of its dependencies are answered, so independent branches overlap their
+        LLM/tool round-trips instead of waiting for a whole level to finish. Subquestions
+        that become ready together share one batched tool vector search and one batched
+        first LLM call; each then continues (tool call, follow-up) on its own.
+        """
+        id_map, indeg, g = _dependency_graph(subs_raw)
+        # Shared with the workers without copying: a subquestion is only dispatched once its
+        # dependencies are in here, and workers only read entries by id
+        answered: Dict[int, dict] = {}
+        # future -> subquestion id, or the list of ids for a batched first pass
+        pending = {}
+
+        with ThreadPoolExecutor(max_workers=MAX_SUBQUESTION_WORKERS) as executor:
+            def dispatch(nids: List[int]) -> None:
+                all_hits = self._ready_tool_hits(nids, id_map, answered)
+                if len(nids) == 1:
+                    future = executor.submit(
+                        self._answer_one_subquestion, id_map[nids[0]], answered, user_query, token, now_iso,
+                        all_hits[0],
+                    )
+                    pending[future] = nids[0]
+                    return
+                future = executor.submit(
+                    self._first_pass_batch, [id_map[nid] for nid in nids], answered, user_query, now_iso, all_hits
+                )
+                pending[future] = nids
+
+            dispatch([nid for nid, d in indeg.items() if d == 0])
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                ready = []
+                for future in done:
+                    key = pending.pop(future)
+                    if isinstance(key, list):
+                        for nid, (skipped, resolved_text, tools, msgs, out) in zip(key, future.result()):
+                            if skipped:
+                                self._mark_answered(nid, skipped, answered, indeg, g, ready)
+                            else:
+                                cont = executor.submit(
+                                    self._finish_subquestion, nid, resolved_text, tools, msgs, out, token
+                                )
+                                pending[cont] = nid
+                        continue
+                    self._mark_answered(key, future.result(), answered, indeg, g, ready)
+                if ready:
+                    dispatch(ready)
+
+        # Report answers in subquestion order, not completion order
+        return {nid: answered[nid] for nid in id_map}
+
+    @staticmethod
+    def _mark_answered(
+        nid: int, ans_obj: dict, answered: Dict[int, dict], indeg: Dict[int, int],
+        g: Dict[int, List[int]], ready: List[int],
+    ) -> None:
+        """Record an answer and collect the dependents it unblocks."""
+        answered[nid] = ans_obj
+        for nei in g.get(nid, ()):
+            indeg[nei] -= 1
+            if indeg[nei] == 0:
+                ready.append(nei)
+
+    async def _arun_subquestions(
+        self, subs_raw: List[dict], user_query: str, token: Optional[str], now_iso: str,
+    ) -> Dict[int, dict]:
+        """Async counterpart of _run_subquestions; an asyncio.Semaphore caps provider concurrency."""
+        id_map, indeg, g = _dependency_graph(subs_raw)
+        answered: Dict[int, dict] = {}
+        sem = asyncio.Semaphore(MAX_SUBQUESTION_WORKERS)
+        pending = set()
+
+        async def run(nid: int, hits: Optional[List[str]]) -> List[Tuple[int, dict]]:
+            async with sem:
+                ans_obj = await self._aanswer_one_subquestion(
+                    id_map[nid], answered, user_query, token, now_iso, hits
+                )
+            return [(nid, ans_obj)]
+
+        async def run_batch(nids: List[int], all_hits: List[Optional[List[str]]]) -> List[Tuple[int, dict]]:
+            # One batched first pass; skipped subquestions are answered here and the
+            # rest continue as their own tasks
+            async with sem:
+                first = await asyncio.to_thread(
+                    self._first_pass_batch, [id_map[nid] for nid in nids], answered, user_query, now_iso, all_hits
+                )
+            skipped_answers = []
+            for nid, (skipped, resolved_text, tools, msgs, out) in zip(nids, first):
+                if skipped:
+                    skipped_answers.append((nid, skipped))
                 else:
-                    fargs = dict(fargs_raw)
+                    pending.add(asyncio.create_task(finish(nid, resolved_text, tools, msgs, out)))
+            return skipped_answers
 
-                # locate tool in registry
-                meta = self.registry.get(fname) if fname else None
-                # if not found by name, try to pick first tool from 'tools' list
-                chosen_func = meta.func if meta else (tools[0] if tools else None)
-                chosen_name = meta.name if meta else (getattr(chosen_func, "__name__", "unknown") if chosen_func else "unknown")
+        async def finish(nid, resolved_text, tools, msgs, out) -> List[Tuple[int, dict]]:
+            async with sem:
+                ans_obj = await self._afinish_subquestion(nid, resolved_text, tools, msgs, out, token)
+            return [(nid, ans_obj)]
 
-                # map aliases to real signature names
-                try:
-                    mapped_args = _map_aliases_to_signature(fargs, chosen_func) if chosen_func else fargs
-                except Exception as e:
-                    logger.debug("Failed to map args for %s: %s. Using raw args.", fname or "unknown", e)
-                    mapped_args = fargs
-
-                logger.info("Calling tool %s with args %s (raw=%s)", chosen_name, mapped_args, fargs_raw)
-                
-                # Trigger tool callback if set
-                if self.tool_callback:
-                    self.tool_callback({
-                        "type": "tool_start",
-                        "tool_name": chosen_name,
-                        "question": resolved_text,
-                        "args": mapped_args
-                    })
-                
-                try:
-                    # execute
-                    result = self._call_callable(chosen_func, mapped_args, token=token)
-                    extracted = result if isinstance(result, dict) else {"result": result}
-                    
-                    # Trigger tool completion callback
-                    if self.tool_callback:
-                        self.tool_callback({
-                            "type": "tool_complete",
-                            "tool_name": chosen_name,
-                            "result": extracted
-                        })
-                    # give the LLM the tool output for finalization / commentary
-                    follow_msgs = msgs + [
-                        {
-                            "role": "assistant",
-                            "content": f"Tool {chosen_name} returned: {json.dumps(extracted, ensure_ascii=False)}",
-                        }
-                    ]
-                    out2 = self.gemini.generate(follow_msgs, tools=None, use_history=False, save_to_history=False)
-                    final_text = out2.get("text") or str(extracted)
-                    ans_obj = {
-                        "id": sq_id,
-                        "answer": final_text,
-                        "used_tools": [chosen_name],
-                        "extracted_data": extracted,
-                    }
-                    answered_by_id[sq_id] = ans_obj
-                except Exception as e:
-                    logger.exception("Tool execution error for %s: %s", chosen_name, e)
-                    ans_obj = {
-                        "id": sq_id,
-                        "answer": f"ERROR executing tool {chosen_name}: {e}",
-                        "used_tools": [chosen_name],
-                        "extracted_data": {},
-                    }
-                    answered_by_id[sq_id] = ans_obj
+        async def dispatch(nids: List[int]) -> None:
+            all_hits = await asyncio.to_thread(self._ready_tool_hits, nids, id_map, answered)
+            if len(nids) == 1:
+                pending.add(asyncio.create_task(run(nids[0], all_hits[0])))
             else:
-                # no function call from LLM - store raw_text as answer
-                ans_obj = {
-                    "id": sq_id,
-                    "answer": raw_text,
-                    "used_tools": [],
-                    "extracted_data": {},
-                }
-                answered_by_id[sq_id] = ans_obj
-
-        # final aggregation prompt
+                pending.add(asyncio.create_task(run_batch(nids, all_hits)))
+
+        await dispatch([nid for nid, d in indeg.items() if d == 0])
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            ready = []
+            for task in done:
+                for nid, ans_obj in task.result():
+                    self._mark_answered(nid, ans_obj, answered, indeg, g, ready)
+            if ready:
+                await dispatch(ready)
+
+        return {nid: answered[nid] for nid in id_map}
+
+    def answer(self, user_query: str, token: Optional[str] = None, bypass_cache: bool = False) -> dict:
+        # One timestamp for the whole query, shared by every subquestion prompt
+        now_iso = _utc_now_iso()
+        cache_key = self._answer_key(user_query, token)
+        if cache_key and not bypass_cache:
+            cached = _ANSWER_CACHE.get(cache_key)
+            if cached is not None:
+                return self._replay_cached_answer(user_query, now_iso, cached)
+
+        subs = self.generate_subquestions_from_query(user_query)
+        subs_raw = [s.dict() for s in subs]
+        answered_by_id = self._run_subquestions(subs_raw, user_query, token, now_iso)
+
+        final_msgs = self._final_answer_msgs(user_query, answered_by_id)
+        final_out = self.gemini.generate(final_msgs, tools=None, use_history=False, save_to_history=False)
+        final_text = final_out.get("text") or "No final text"
+        return self._finish_answer(user_query, now_iso, subs_raw, answered_by_id, final_text, cache_key)
+
+    async def aanswer(self, user_query: str, token: Optional[str] = None, bypass_cache: bool = False) -> dict:
+        """
+        Async variant of answer() for callers running inside an event loop (e.g. FastAPI).
+        LLM calls are awaited, and subquestions are scheduled as tasks capped by a semaphore.
+        """
+        now_iso = _utc_now_iso()
+        cache_key = self._answer_key(user_query, token)
+        if cache_key and not bypass_cache:
+            cached = _ANSWER_CACHE.get(cache_key)
+            if cached is not None:
+                return self._replay_cached_answer(user_query, now_iso, cached)
+
+        subs = await self.agenerate_subquestions_from_query(user_query)
+        subs_raw = [s.dict() for s in subs]
+        answered_by_id = await self._arun_subquestions(subs_raw, user_query, token, now_iso)
+
+        final_msgs = self._final_answer_msgs(user_query, answered_by_id)
+        final_out = await self.gemini.agenerate(final_msgs, tools=None, use_history=False, save_to_history=False)
+        final_text = final_out.get("text") or "No final text"
+        return self._finish_answer(user_query, now_iso, subs_raw, answered_by_id, final_text, cache_key)
+
+    def _final_answer_msgs(self, user_query: str, answered_by_id: Dict[int, dict]) -> List[Dict[str, str]]:
+        # final aggregation prompt, collected in one list and joined once
+        parts = [FINAL_ANSWER_PROMPT]
         # Add conversation context for better coherence
-        context_str = ""
         if self.conversation_history:
-            context_str = "\n\nConversation context:\n"
-            for exchange in self.conversation_history[-2:]:
-                context_str += f"Previous Q: {exchange['user_query']}\n"
-                context_str += f"Previous A: {exchange['assistant_response'][:200]}...\n\n"
-        
-        final_prompt = (
-            FINAL_ANSWER_PROMPT
-            + context_str
-            + f"\n\nCâu hỏi hiện tại:\n{user_query}\n\n"
-            + f"Các subquestions và kết quả:\n{json.dumps(list(answered_by_id.values()), ensure_ascii=False)}\n\n"
-        )
+            parts.append("\n\nConversation context:\n")
+            for exchange in self._recent_exchanges(2):
+                parts.append(
+                    f"Previous Q: {exchange['user_query']}\n"
+                    f"Previous A: {exchange['assistant_response'][:200]}...\n\n"
+                )
+        parts.append(f"\n\nCâu hỏi hiện tại:\n{user_query}\n\n")
+        parts.append("Các subquestions và kết quả:\n")
+
+        # Subquestion answers already summarize their tool output, so send only the
+        # answer text (truncated) instead of re-serializing every extracted_data blob
+        for a in answered_by_id.values():
+            ans_text = str(a.get("answer") or "")
+            if len(ans_text) > MAX_SUBANSWER_CHARS:
+                ans_text = ans_text[:MAX_SUBANSWER_CHARS] + "..."
+            parts.append(f"### SubQ {a['id']}\nAnswer: {ans_text}\nTools: {a['used_tools']}\n")
+        parts.append("\n")
+        final_prompt = "".join(parts)
         final_msgs = [
             {"role": "system", "content": "Bạn là một trợ lý tài chính."},
             {"role": "user", "content": final_prompt},
         ]
-        final_out = self.gemini.generate(final_msgs, tools=None, use_history=False, save_to_history=False)
-        final_text = final_out.get("text") or "No final text"
-        
-        # Save this exchange to conversation history
+        return final_msgs
+
+    def _finish_answer(
+        self, user_query: str, now_iso: str, subs_raw: List[dict],
+        answered_by_id: Dict[int, dict], final_text: str, cache_key: Optional[str] = None,
+    ) -> dict:
+        answered = list(answered_by_id.values())
+        self._record_exchange(user_query, final_text, now_iso, answered)
+
+        result = {
+            "report": final_text, 
+            "answered_subquestions": answered,
+            "subquestions": subs_raw  # Include original subquestions for debugging
+        }
+        # Don't cache answers that changed user data, repeating the query must repeat the action
+        if cache_key and not any(t in _MUTATING_TOOLS for a in answered for t in a.get("used_tools", [])):
+            _ANSWER_CACHE.set(cache_key, copy.deepcopy(result))
+        return result
+
+    def _replay_cached_answer(self, user_query: str, now_iso: str, cached: dict) -> dict:
+        logger.info("Answer cache hit for query: %s", user_query)
+        # Deep copy so neither the caller nor the history entry shares state with the cache
+        result = copy.deepcopy(cached)
+        self._record_exchange(user_query, result["report"], now_iso, result["answered_subquestions"])
+        return result
+
+    def _record_exchange(self, user_query: str, final_text: str, now_iso: str, answered: List[dict]) -> None:
+        # Save this exchange to conversation history; the deque drops the oldest one when full
         self.conversation_history.append({
             "user_query": user_query,
             "assistant_response": final_text,
-            "timestamp": datetime.datetime.utcnow().isoformat(),
-            "answered_subquestions": list(answered_by_id.values())
+            "timestamp": now_iso,
+            "answered_subquestions": answered
         })
-        
-        # Keep only last 10 exchanges to avoid context overflow
-        if len(self.conversation_history) > 10:
-            self.conversation_history = self.conversation_history[-10:]
-        
-        return {
-            "report": final_text, 
-            "answered_subquestions": list(answered_by_id.values()),
-            "subquestions": subs_raw  # Include original subquestions for debugging
-        }
+
+    def _recent_exchanges(self, n: int):
+        """Iterate over the last n exchanges without copying the history."""
+        history = self.conversation_history
+        return itertools.islice(history, max(0, len(history) - n), None)
     
     def get_conversation_history(self) -> List[Dict[str, Any]]:
         """Get the conversation history for this agent instance."""
-        return self.conversation_history.copy()
+        return list(self.conversation_history)
     
     def clear_conversation_history(self) -> None:
         """Clear the conversation history for this agent instance."""
-        self.conversation_history = []
+        self.conversation_history.clear()
         logger.info("Conversation history cleared")
     
     def get_conversation_summary(self) -> Dict[str, Any]:
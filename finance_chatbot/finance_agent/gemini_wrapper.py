@@ -11,158 +11,462 @@ Changes from original:
 - Added chat history management for context preservation
 """
 import os
-import json
+import asyncio
+import functools
 import inspect
+import itertools
 import logging
+import re
+import time
+import weakref
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
-from typing import Any, Dict, List, Callable, Optional, Union
-from openai import OpenAI
+from typing import TYPE_CHECKING, Any, Dict, List, Callable, Optional, Union
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
+from .utils import json_dumps, json_loads
+
+try:  # Optional: compact binary history snapshots (*.msgpack / *.mpk)
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:  # Optional: stream-parse legacy single-document history files
+    import ijson
+except ImportError:
+    ijson = None
 
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 GEMINI_API_KEY_ENV = "GEMINI_API_KEY"
 
-USE_REAL = bool(os.getenv(GEMINI_API_KEY_ENV, "").strip())
+# Read once at import; every wrapper reuses it instead of querying the environment again
+_GEMINI_KEY = os.getenv(GEMINI_API_KEY_ENV, "").strip() or None
+
+USE_REAL = _GEMINI_KEY is not None
+
+# One keep-alive connection pool shared by every wrapper (each chat session creates
+# its own agent), so LLM calls reuse open TLS connections instead of handshaking again.
+# The OpenAI SDK (and httpx under it) is imported only once a real client is built:
+# it takes about a second to import, which mock-mode processes never need to pay.
+_HTTP_CLIENT: Optional["httpx.Client"] = None
+
+
+def _get_http_client() -> "httpx.Client":
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        import httpx
+        _HTTP_CLIENT = httpx.Client(
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+    return _HTTP_CLIENT
+
+
+MSGPACK_SUFFIXES = (".msgpack", ".mpk")
+
+
+def _iso_to_ns(ts: str) -> Optional[int]:
+    try:
+        return int(datetime.fromisoformat(ts).timestamp() * 1e6) * 1000
+    except (TypeError, ValueError):
+        return None
+
+
+def _ns_to_iso(ns: Optional[int]) -> str:
+    return datetime.fromtimestamp(ns / 1e9).isoformat() if ns is not None else ""
+
+
+class _AsyncThrottle:
+    """
+    Provider-wide limits for async calls: at most `concurrency` requests in flight per
+    event loop, started no faster than `qpm` per minute (0 disables pacing).
+    """
+
+    def __init__(self, concurrency: int, qpm: int):
+        self.concurrency = concurrency
+        self.interval = 60.0 / qpm if qpm > 0 else 0.0
+        self._next_start = 0.0
+        self._sems: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        sem = self._sems.get(loop)
+        if sem is None:
+            sem = self._sems[loop] = asyncio.Semaphore(self.concurrency)
+        return sem
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._semaphore():
+            if self.interval:
+                # Reserve the next start time, then wait for it
+                now = time.monotonic()
+                start = max(now, self._next_start)
+                self._next_start = start + self.interval
+                if start > now:
+                    await asyncio.sleep(start - now)
+            yield
+
+
+_THROTTLE = _AsyncThrottle(
+    concurrency=int(os.getenv("GEMINI_CONCURRENCY", "32")),
+    qpm=int(os.getenv("GEMINI_QPM", "0")),
+)
 
 
 class ChatHistory:
     """Manages conversation history for the chat session"""
     
-    def __init__(self, max_messages: int = 100, max_tokens_estimate: int = 8000):
+    def __init__(self, max_messages: int = 100, max_tokens_estimate: int = 8000,
+                 log_path: Union[str, Path] = None):
         """
         Initialize chat history manager
         
         Args:
             max_messages: Maximum number of messages to keep in history
             max_tokens_estimate: Estimated max tokens to keep (rough estimate: 1 token ≈ 4 chars)
+            log_path: Optional JSONL file every message is appended to as it is added
         """
+        # Messages are stored exactly as the API wants them; timestamps live in a
+        # parallel list (epoch ns, formatted on demand) so get_messages() needn't
+        # rebuild every dict per request
         self.messages: List[Dict[str, str]] = []
+        self._timestamps: List[Optional[int]] = []
         self.max_messages = max_messages
         self.max_tokens_estimate = max_tokens_estimate
-        self.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._created_ns = time.time_ns()
+        self._session_id: Optional[str] = None
+        # Running sum of len(content) and per-role message counts over self.messages,
+        # kept in step by every mutation so get_summary doesn't rescan the history
+        self._total_chars = 0
+        self._role_counts: Dict[str, int] = {}
+        self._log_fh = None
+        if log_path is not None:
+            self.open_log(log_path)
+
+    @property
+    def session_id(self) -> str:
+        if self._session_id is None:
+            self._session_id = datetime.fromtimestamp(self._created_ns / 1e9).strftime("%Y%m%d_%H%M%S")
+        return self._session_id
+
+    @session_id.setter
+    def session_id(self, value: str) -> None:
+        self._session_id = value
+
+    def open_log(self, log_path: Union[str, Path]) -> None:
+        """Start appending every new message to a JSONL log (one record per line)"""
+        self.close_log()
+        log_path = Path(log_path)
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        is_new = not log_path.exists() or log_path.stat().st_size == 0
+        # Block-buffered: records collect in the buffer and each public mutation
+        # flushes once, so an exchange costs one write syscall instead of one per line
+        self._log_fh = open(log_path, "a", encoding="utf-8")
+        if is_new:
+            self._append_record(self._metadata_record())
+            self._flush_log()
+
+    def close_log(self) -> None:
+        if self._log_fh is not None:
+            self._log_fh.close()
+            self._log_fh = None
+
+    def _metadata_record(self) -> Dict[str, str]:
+        return {"type": "session_metadata", "session_id": self.session_id, "created_at": datetime.now().isoformat()}
+
+    def _append_record(self, record: Dict[str, Any]) -> None:
+        if self._log_fh is not None:
+            self._log_fh.write(json_dumps(record) + "\n")
+
+    def _flush_log(self) -> None:
+        if self._log_fh is not None:
+            self._log_fh.flush()
         
     def add_message(self, role: str, content: str) -> None:
         """Add a message to the history"""
-        self.messages.append({
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        })
-        self._trim_history()
+        self._add(role, content)
+        self._flush_log()
         
     def add_exchange(self, user_msg: str, assistant_msg: str) -> None:
         """Add a user-assistant exchange to history"""
-        self.add_message("user", user_msg)
-        self.add_message("assistant", assistant_msg)
+        self._add("user", user_msg)
+        self._add("assistant", assistant_msg)
+        self._flush_log()
+
+    def _add(self, role: str, content: str) -> None:
+        ts_ns = time.time_ns()
+        self.messages.append({"role": role, "content": content})
+        self._timestamps.append(ts_ns)
+        self._total_chars += len(content)
+        self._role_counts[role] = self._role_counts.get(role, 0) + 1
+        if self._log_fh is not None:
+            self._append_record({"role": role, "content": content, "timestamp": _ns_to_iso(ts_ns)})
+        self._trim_history()
         
+    def _forget(self, msg: Dict[str, str]) -> None:
+        """Update the running counters for a message dropped from history"""
+        self._total_chars -= len(msg.get("content", ""))
+        role = msg.get("role")
+        self._role_counts[role] = self._role_counts.get(role, 0) - 1
+
+    def _recount(self) -> None:
+        self._total_chars = 0
+        self._role_counts = {}
+        for m in self.messages:
+            self._total_chars += len(m.get("content", ""))
+            role = m.get("role")
+            self._role_counts[role] = self._role_counts.get(role, 0) + 1
+
+    def _select(self, indices: List[int]) -> None:
+        """Keep only the messages at the given positions (and their timestamps), in that order"""
+        self.messages = [self.messages[i] for i in indices]
+        self._timestamps = [self._timestamps[i] for i in indices]
+
+    def _set_messages(self, records: List[Dict[str, str]]) -> None:
+        """Replace the history with loaded records, splitting out their timestamps"""
+        self.messages = []
+        self._timestamps = []
+        for record in records:
+            msg = dict(record)
+            self._timestamps.append(_iso_to_ns(msg.pop("timestamp", None)))
+            self.messages.append(msg)
+
+    def _system_prefix(self) -> Optional[int]:
+        """Number of leading system messages if every system message is at the front, else None"""
+        n_sys = self._role_counts.get("system", 0)
+        if all(m.get("role") == "system" for m in itertools.islice(self.messages, n_sys)):
+            return n_sys
+        return None
+
+    def _drop_range(self, start: int, end: int) -> None:
+        for m in itertools.islice(self.messages, start, end):
+            self._forget(m)
+        del self.messages[start:end]
+        del self._timestamps[start:end]
+
     def _trim_history(self) -> None:
-        """Trim history to respect limits"""
+        """Trim history to respect limits (one pass over the messages, no re-summing)"""
+        # Common case: system messages are front-loaded, so the oldest non-system
+        # messages form one contiguous slice right after them and are dropped in place
+        n_sys = self._system_prefix()
+        
         # Trim by message count
         if len(self.messages) > self.max_messages:
             # Keep system messages and recent messages
-            system_msgs = [m for m in self.messages if m.get("role") == "system"]
-            other_msgs = [m for m in self.messages if m.get("role") != "system"]
-            keep_count = self.max_messages - len(system_msgs)
-            self.messages = system_msgs + other_msgs[-keep_count:]
+            if n_sys is not None:
+                drop = len(self.messages) - n_sys - max(self.max_messages - n_sys, 0)
+                self._drop_range(n_sys, n_sys + drop)
+            else:
+                system_idx, other_idx = [], []
+                for i, m in enumerate(self.messages):
+                    (system_idx if m.get("role") == "system" else other_idx).append(i)
+                drop = len(other_idx) - max(self.max_messages - len(system_idx), 0)
+                for i in other_idx[:drop]:
+                    self._forget(self.messages[i])
+                self._select(system_idx + other_idx[drop:])
+                # Survivors are now ordered system-first
+                n_sys = len(system_idx)
             
-        # Trim by estimated tokens (rough estimation)
-        total_chars = sum(len(m.get("content", "")) for m in self.messages)
-        estimated_tokens = total_chars // 4  # Rough estimate
-        
-        if estimated_tokens > self.max_tokens_estimate:
-            # Keep removing oldest non-system messages until under limit
-            while estimated_tokens > self.max_tokens_estimate and len(self.messages) > 1:
-                for i, msg in enumerate(self.messages):
-                    if msg.get("role") != "system":
-                        self.messages.pop(i)
-                        break
-                total_chars = sum(len(m.get("content", "")) for m in self.messages)
-                estimated_tokens = total_chars // 4
+        # Trim by estimated tokens (rough estimate: 1 token ≈ 4 chars)
+        if self._total_chars // 4 > self.max_tokens_estimate:
+            # Drop the oldest non-system messages until under limit, keeping at least one message
+            if n_sys is not None:
+                chars = self._total_chars
+                end = n_sys
+                remaining = len(self.messages)
+                while end < len(self.messages) and chars // 4 > self.max_tokens_estimate and remaining > 1:
+                    chars -= len(self.messages[end].get("content", ""))
+                    end += 1
+                    remaining -= 1
+                self._drop_range(n_sys, end)
+                return
+            kept = []
+            remaining = len(self.messages)
+            for i, m in enumerate(self.messages):
+                if (self._total_chars // 4 > self.max_tokens_estimate and remaining > 1
+                        and m.get("role") != "system"):
+                    self._forget(m)
+                    remaining -= 1
+                    continue
+                kept.append(i)
+            self._select(kept)
                 
     def get_messages(self, include_timestamps: bool = False) -> List[Dict[str, str]]:
         """Get all messages in history"""
         if include_timestamps:
-            return self.messages.copy()
-        else:
-            # Return without timestamps for API calls
-            return [{k: v for k, v in msg.items() if k != "timestamp"} for msg in self.messages]
+            return [{**msg, "timestamp": _ns_to_iso(ts)} for msg, ts in zip(self.messages, self._timestamps)]
+        # Stored without timestamps already: a shallow copy is all API calls need
+        return list(self.messages)
             
     def clear(self) -> None:
         """Clear all messages from history"""
         self.messages = []
+        self._timestamps = []
+        self._total_chars = 0
+        self._role_counts = {}
+        # Replaying the log must also forget everything before this point
+        self._append_record({"type": "clear", "timestamp": datetime.now().isoformat()})
+        self._flush_log()
         
     def save_to_file(self, filepath: Union[str, Path] = None) -> str:
-        """Save history to a JSON file"""
+        """
+        Save a snapshot of the history as JSONL: a session_metadata record followed by
+        one line per message, written as they are serialized.
+        A .msgpack/.mpk path writes a MessagePack document instead (requires msgpack).
+        """
         if filepath is None:
-            filepath = f"chat_history_{self.session_id}.json"
+            filepath = f"chat_history_{self.session_id}.jsonl"
         
         filepath = Path(filepath)
         filepath.parent.mkdir(parents=True, exist_ok=True)
         
+        if filepath.suffix in MSGPACK_SUFFIXES:
+            self._save_msgpack(filepath)
+            logger.info(f"Chat history saved to {filepath}")
+            return str(filepath)
+        
         with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump({
+            f.write(json_dumps({
+                "type": "session_metadata",
                 "session_id": self.session_id,
-                "messages": self.messages,
                 "saved_at": datetime.now().isoformat()
-            }, f, ensure_ascii=False, indent=2)
+            }) + "\n")
+            for msg, ts in zip(self.messages, self._timestamps):
+                f.write(json_dumps({**msg, "timestamp": _ns_to_iso(ts)}) + "\n")
             
         logger.info(f"Chat history saved to {filepath}")
         return str(filepath)
+
+    def _save_msgpack(self, filepath: Path) -> None:
+        if msgpack is None:
+            raise ImportError("msgpack is required to save history as MessagePack")
+        # Timestamps go out as epoch milliseconds rather than ISO strings
+        data = {
+            "session_id": self.session_id,
+            "saved_at": time.time_ns() // 1_000_000,
+            "messages": [
+                {**msg, "ts": ts // 1_000_000 if ts is not None else None}
+                for msg, ts in zip(self.messages, self._timestamps)
+            ],
+        }
+        with open(filepath, "wb") as f:
+            f.write(msgpack.packb(data, use_bin_type=True))
+
+    def _load_msgpack(self, filepath: Path) -> None:
+        if msgpack is None:
+            raise ImportError("msgpack is required to load MessagePack history")
+        with open(filepath, "rb") as f:
+            data = msgpack.unpackb(f.read(), raw=False)
+        self.session_id = data.get("session_id", self.session_id)
+        self.messages = []
+        self._timestamps = []
+        for m in data.get("messages", []):
+            m = dict(m)
+            ts_ms = m.pop("ts", None)
+            self._timestamps.append(ts_ms * 1_000_000 if ts_ms is not None else None)
+            self.messages.append(m)
         
     def load_from_file(self, filepath: Union[str, Path]) -> None:
-        """Load history from a JSON file"""
+        """Load history from a JSONL log/snapshot, a MessagePack snapshot, or a legacy single-document JSON file"""
         filepath = Path(filepath)
         
         if not filepath.exists():
             logger.warning(f"History file not found: {filepath}")
             return
             
+        if filepath.suffix in MSGPACK_SUFFIXES:
+            self._load_msgpack(filepath)
+            self._recount()
+            logger.info(f"Chat history loaded from {filepath} ({len(self.messages)} messages)")
+            return
+            
         with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+            first = f.readline()
+            legacy = first.strip() == "{"
+            if legacy:
+                # Legacy format: one indented JSON document
+                self._load_legacy(filepath)
+            else:
+                messages = []
+                for line in itertools.chain((first,), f):
+                    if not line.strip():
+                        continue
+                    record = json_loads(line)
+                    rtype = record.get("type")
+                    if rtype == "session_metadata":
+                        self.session_id = record.get("session_id", self.session_id)
+                    elif rtype == "clear":
+                        messages = []
+                    else:
+                        messages.append(record)
+                self._set_messages(messages)
             
-        self.messages = data.get("messages", [])
-        self.session_id = data.get("session_id", self.session_id)
+        self._recount()
+        if not legacy:
+            # An append-only log holds the whole session, not just what fits the limits
+            self._trim_history()
         logger.info(f"Chat history loaded from {filepath} ({len(self.messages)} messages)")
         
+    def _load_legacy(self, filepath: Path) -> None:
+        with open(filepath, 'rb') as f:
+            if ijson is None:
+                data = json_loads(f.read())
+                self._set_messages(data.get("messages", []))
+                self.session_id = data.get("session_id", self.session_id)
+                return
+            # Walk the top-level keys without holding the raw file text in memory
+            for key, value in ijson.kvitems(f, "", use_float=True):
+                if key == "messages":
+                    self._set_messages(value)
+                elif key == "session_id":
+                    self.session_id = value
+        
     def get_summary(self) -> Dict[str, Any]:
         """Get a summary of the current history"""
         return {
             "session_id": self.session_id,
             "total_messages": len(self.messages),
-            "user_messages": len([m for m in self.messages if m.get("role") == "user"]),
-            "assistant_messages": len([m for m in self.messages if m.get("role") == "assistant"]),
-            "system_messages": len([m for m in self.messages if m.get("role") == "system"]),
-            "estimated_tokens": sum(len(m.get("content", "")) for m in self.messages) // 4
+            "user_messages": self._role_counts.get("user", 0),
+            "assistant_messages": self._role_counts.get("assistant", 0),
+            "system_messages": self._role_counts.get("system", 0),
+            "estimated_tokens": self._total_chars // 4
         }
 
 
+TYPE_MAP = {str: "string", int: "integer", float: "number", bool: "boolean"}
+
+
 def _callable_to_schema(func: Callable) -> Dict:
     """
     Build a simple JSON schema for function parameters based on signature.
     Defaults to string for unknown annotations.
+    Cached per callable: the returned schema is shared and must not be mutated.
     """
+    try:
+        return _cached_schema(func)
+    except TypeError:
+        # Unhashable callable (e.g. an instance defining __eq__ without __hash__)
+        return _build_schema(func)
+
+
+def _build_schema(func: Callable) -> Dict:
     sig = inspect.signature(func)
     props = {}
     required = []
     for name, param in sig.parameters.items():
         if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
             continue
-        ann = param.annotation
-        if ann == inspect._empty:
-            t = "string"
-        elif ann in (str,):
-            t = "string"
-        elif ann in (int,):
-            t = "integer"
-        elif ann in (float,):
-            t = "number"
-        elif ann in (bool,):
-            t = "boolean"
-        else:
-            t = "string"
+        t = TYPE_MAP.get(param.annotation, "string")
         props[name] = {"type": t, "description": f"Parameter {name} of {func.__name__}"}
         if param.default == inspect._empty:
             required.append(name)
@@ -172,6 +476,226 @@ def _callable_to_schema(func: Callable) -> Dict:
     return schema
 
 
+_cached_schema = functools.lru_cache(maxsize=256)(_build_schema)
+
+
+# Mock LLM lookup tables. _VN_STOCKS is ordered: the first listed code found wins.
+_VN_STOCKS = ("fpt", "vcb", "hpg", "vnm", "mwg", "vhm", "tpb", "tcb", "bid", "ctg", "vib")
+# Every term the mock reacts to (ticker codes and keywords), found in one scan
+_MOCK_TERMS_RE = re.compile(
+    r"\b(" + "|".join(_VN_STOCKS) + r"|hose|hnx|usd|vnd|việt nam|vietnam|lạm phát|inflation|cpi|gdp"
+    r"|thất nghiệp|unemployment|lãi suất|interest)\b"
+)
+
+
+# Mock tool-argument builders: (found_stock, keywords) -> arguments
+
+
+def _mock_symbol_args(found_stock: Optional[str], keywords: set) -> Dict[str, Any]:
+    # Extract company name from query
+    return {"company_name": found_stock or "FPT"}
+
+
+def _mock_ticker_args(found_stock: Optional[str], keywords: set) -> Dict[str, Any]:
+    return {"ticker": f"{found_stock}.VN" if found_stock else "FPT.VN"}
+
+
+def _mock_exchange_args(found_stock: Optional[str], keywords: set) -> Dict[str, Any]:
+    if "hnx" in keywords and "hose" not in keywords:
+        return {"exchange": "HNX"}
+    return {"exchange": "HOSE"}
+
+
+def _mock_currency_args(found_stock: Optional[str], keywords: set) -> Dict[str, Any]:
+    # Only USD -> VND is mocked
+    return {"from_currency": "USD", "to_currency": "VND", "amount": 1.0}
+
+
+def _mock_macro_args(found_stock: Optional[str], keywords: set) -> Dict[str, Any]:
+    country = "Vietnam" if "việt nam" in keywords or "vietnam" in keywords else "US"
+    # Map Vietnamese terms to indicators
+    if keywords & {"lạm phát", "inflation", "cpi"}:
+        indicator = "inflation_cpi"
+    elif "gdp" in keywords:
+        indicator = "gdp"
+    elif "thất nghiệp" in keywords or "unemployment" in keywords:
+        indicator = "unemployment"
+    elif "lãi suất" in keywords or "interest" in keywords:
+        indicator = "interest_rate"
+    else:
+        indicator = "gdp"
+    return {"country": country, "indicator": indicator}
+
+
+def _mock_search_args(found_stock: Optional[str], keywords: set) -> Dict[str, Any]:
+    return {"query": "FPT stock news" if found_stock else "stock market news"}
+
+
+def _mock_compare_args(found_stock: Optional[str], keywords: set) -> Dict[str, Any]:
+    # Need multiple tickers
+    return {"tickers": ["FPT.VN", "MWG.VN", "VCB.VN"]}
+
+
+def _mock_correlation_args(found_stock: Optional[str], keywords: set) -> Dict[str, Any]:
+    return {"tickers": ["FPT.VN", "MWG.VN", "VCB.VN"], "period": "1y"}
+
+
+def _mock_portfolio_args(found_stock: Optional[str], keywords: set) -> Dict[str, Any]:
+    return {"portfolio": {"FPT.VN": 0.4, "MWG.VN": 0.3, "VCB.VN": 0.3}}
+
+
+def _mock_default_args(found_stock: Optional[str], keywords: set) -> Dict[str, Any]:
+    return {"ticker": "FPT.VN"}
+
+
+_MOCK_TOOLS: Dict[str, Callable[[Optional[str], set], Dict[str, Any]]] = {
+    "get_stock_symbol": _mock_symbol_args,
+    "get_exchange_info": _mock_exchange_args,
+    "get_currency_rate": _mock_currency_args,
+    "get_macro_data": _mock_macro_args,
+    "google_search": _mock_search_args,
+    "search_news": _mock_search_args,
+    "compare_fundamentals": _mock_compare_args,
+    "compare_with_peers": _mock_compare_args,
+    "get_correlation_matrix": _mock_correlation_args,
+    "analyze_portfolio": _mock_portfolio_args,
+}
+_MOCK_TOOLS.update(dict.fromkeys((
+    "get_stock_price", "get_fundamentals", "get_sector_mapping",
+    "calculate_ratios", "estimate_fair_value", "analyze_cashflow",
+    "get_technical_indicators", "get_risk_metrics", "generate_price_chart",
+    "get_income_statement", "get_balance_sheet", "get_pattern_recognition",
+    "get_candlestick_analysis", "get_signal_summary", "get_advanced_ratios",
+), _mock_ticker_args))
+
+
+# Role rewrites for the OpenAI-compatible endpoint: system messages become prefixed
+# user messages, unknown roles fall back to user.
+_ROLE_DISPATCH: Dict[str, Callable[[str], Dict[str, str]]] = {
+    "system": lambda c: {"role": "user", "content": f"[System Instructions]: {c}"},
+    "user": lambda c: {"role": "user", "content": c},
+    "assistant": lambda c: {"role": "assistant", "content": c},
+}
+_DEFAULT_ROLE = _ROLE_DISPATCH["user"]
+
+# How many trailing history messages generate() checks for re-sent duplicates
+HISTORY_DEDUP_WINDOW = 5
+
+
+def _history_overlap(history_messages: List[Dict], messages: List[Dict]) -> int:
+    """
+    Length of the longest run at the start of messages that repeats the end of the
+    history (at most HISTORY_DEDUP_WINDOW). The final message never counts, so a
+    repeated question is still asked.
+    """
+    tail = [(m.get("role"), m.get("content")) for m in history_messages[-HISTORY_DEDUP_WINDOW:]]
+    head = [(m.get("role", "user"), m.get("content", "")) for m in messages[:-1]]
+    for k in range(min(len(tail), len(head)), 0, -1):
+        if tail[-k:] == head[:k]:
+            return k
+    return 0
+
+
+def _response_format(schema: Dict) -> Dict[str, Any]:
+    """OpenAI-style structured output parameter for a JSON schema"""
+    return {"type": "json_schema", "json_schema": {"name": "response", "schema": schema}}
+
+
+class _ToolCallScanner:
+    """
+    Watches streamed reply text for a leading JSON object (the prompt's function_call reply).
+    feed() returns the index just past the object's closing brace once it is complete, else -1.
+    Replies that open with prose are never cut short.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.prose = False
+        self.in_str = False
+        self.escape = False
+        self.prefix = ""
+
+    def feed(self, chunk: str) -> int:
+        if self.prose:
+            return -1
+        for i, ch in enumerate(chunk):
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self.depth = 1
+                elif not (ch.isspace() or ch == "`"):
+                    # Only a ```json fence may come before the object
+                    self.prefix += ch.lower()
+                    if not "json".startswith(self.prefix):
+                        self.prose = True
+                        return -1
+            elif self.in_str:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_str = False
+            elif ch == '"':
+                self.in_str = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    return i + 1
+        return -1
+
+
+def _chunk_text(chunk: Any) -> str:
+    return (chunk.choices[0].delta.content or "") if chunk.choices else ""
+
+
+_BATCH_HEADER = (
+    "Answer each of the following {n} independent tasks on its own, as if it were the "
+    "only request. Return ONLY a JSON array of length {n} where item i answers TASK i "
+    'and has the form {{"text": <your reply as a string, or null>, '
+    '"function_call": <{{"name": ..., "arguments": {{...}}}} or null>}}.\n'
+)
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def _batch_prompt(batch: List[List[Dict]]) -> str:
+    parts = [_BATCH_HEADER.format(n=len(batch))]
+    for i, messages in enumerate(batch, 1):
+        parts.append(f"\n=== TASK {i} ===\n")
+        for m in messages:
+            parts.append(f"[{m.get('role', 'user')}]: {m.get('content', '')}\n")
+    return "".join(parts)
+
+
+def _parse_batch_reply(text: Optional[str], n: int) -> Optional[List[Dict[str, Any]]]:
+    """Split a batched reply into n {"text", "function_call"} items, or None if it doesn't fit"""
+    if not text:
+        return None
+    try:
+        data = json_loads(_FENCE_RE.sub("", text.strip()))
+    except Exception:
+        return None
+    if not isinstance(data, list) or len(data) != n:
+        return None
+    items = []
+    for item in data:
+        if isinstance(item, str):
+            items.append({"text": item, "function_call": None})
+        elif isinstance(item, dict):
+            fc = item.get("function_call")
+            text_val = item.get("text")
+            items.append({
+                "text": text_val if isinstance(text_val, str) or text_val is None else json_dumps(text_val),
+                "function_call": fc if isinstance(fc, dict) and fc.get("name") else None,
+            })
+        else:
+            return None
+    return items
+
+
 class GeminiWrapper:
     """
     Wrapper: if GEMINI_API_KEY provided -> real calls using OpenAI SDK with Gemini endpoint
@@ -187,18 +711,22 @@ class GeminiWrapper:
         Args:
             model: Model name to use
             enable_history: Whether to enable chat history tracking
-            history_config: Configuration for chat history (max_messages, max_tokens_estimate)
+            history_config: Configuration for chat history (max_messages, max_tokens_estimate, log_path)
         """
         self.model_name = model
         self.use_real = USE_REAL
         self.enable_history = enable_history
+        # Created on first agenerate, per event loop
+        self._aclient: Optional["AsyncOpenAI"] = None
+        self._aclient_loop = None
         
         # Initialize chat history if enabled
         if self.enable_history:
             history_config = history_config or {}
             self.history = ChatHistory(
                 max_messages=history_config.get('max_messages', 100),
-                max_tokens_estimate=history_config.get('max_tokens_estimate', 8000)
+                max_tokens_estimate=history_config.get('max_tokens_estimate', 8000),
+                log_path=history_config.get('log_path')
             )
         else:
             self.history = None
@@ -206,9 +734,11 @@ class GeminiWrapper:
         if self.use_real:
             try:
                 # Khởi tạo OpenAI client với Gemini endpoint
+                from openai import OpenAI
                 self.client = OpenAI(
                     base_url="https://openrouter.ai/api/v1",
-                    api_key=os.getenv(GEMINI_API_KEY_ENV)
+                    api_key=_GEMINI_KEY,
+                    http_client=_get_http_client(),
                 )
                 self.model = model
             except Exception as e:
@@ -234,7 +764,8 @@ class GeminiWrapper:
         """
         A very small deterministic mock LLM.
         """
-        joined = " ".join(m.get("content", "") for m in messages).lower()
+        # Intent detection only looks at the latest turn, tokenized once
+        joined = messages[-1].get("content", "").casefold() if messages else ""
         out = {"text": None, "function_call": None, "raw": None}
 
         # detect subquestion generation intent
@@ -243,7 +774,7 @@ class GeminiWrapper:
                 {"id": 1, "question": "What is the ticker for FPT?", "depends_on": []},
                 {"id": 2, "question": "What is the current price of {{TICKER_FROM_Q1}}?", "depends_on": [1]}
             ]}
-            out["text"] = json.dumps(json_out)
+            out["text"] = json_dumps(json_out)
             return out
 
         # detect tool request and generate appropriate arguments
@@ -253,85 +784,13 @@ class GeminiWrapper:
             
             if tool_name:
                 # Generate appropriate arguments based on tool name
-                arguments = {}
+                keywords = set(_MOCK_TERMS_RE.findall(joined))
                 
                 # Extract company/ticker names from query
-                # Common Vietnamese stock codes
-                vn_stocks = ["fpt", "vcb", "hpg", "vnm", "mwg", "vhm", "tpb", "tcb", "bid", "ctg", "vib"]
-                found_stock = None
-                for stock in vn_stocks:
-                    if stock in joined:
-                        found_stock = stock.upper()
-                        break
+                found_stock = next((s.upper() for s in _VN_STOCKS if s in keywords), None)
                 
-                # Map tool names to their expected arguments
-                if tool_name == "get_stock_symbol":
-                    # Extract company name from query
-                    company = found_stock or "FPT"
-                    arguments = {"company_name": company}
-                    
-                elif tool_name in ["get_stock_price", "get_fundamentals", "get_sector_mapping", 
-                                  "calculate_ratios", "estimate_fair_value", "analyze_cashflow",
-                                  "get_technical_indicators", "get_risk_metrics", "generate_price_chart",
-                                  "get_income_statement", "get_balance_sheet", "get_pattern_recognition",
-                                  "get_candlestick_analysis", "get_signal_summary", "get_advanced_ratios"]:
-                    ticker = f"{found_stock}.VN" if found_stock else "FPT.VN"
-                    arguments = {"ticker": ticker}
-                    
-                elif tool_name == "get_exchange_info":
-                    if "hose" in joined:
-                        arguments = {"exchange": "HOSE"}
-                    elif "hnx" in joined:
-                        arguments = {"exchange": "HNX"}
-                    else:
-                        arguments = {"exchange": "HOSE"}
-                        
-                elif tool_name == "get_currency_rate":
-                    # Extract currency codes
-                    from_curr = "USD"
-                    to_curr = "VND"
-                    if "usd" in joined:
-                        from_curr = "USD"
-                    if "vnd" in joined or "việt nam" in joined:
-                        to_curr = "VND"
-                    arguments = {"from_currency": from_curr, "to_currency": to_curr, "amount": 1.0}
-                    
-                elif tool_name == "get_macro_data":
-                    country = "Vietnam" if "việt nam" in joined or "vietnam" in joined else "US"
-                    # Map Vietnamese terms to indicators
-                    if "lạm phát" in joined or "inflation" in joined or "cpi" in joined:
-                        indicator = "inflation_cpi"
-                    elif "gdp" in joined:
-                        indicator = "gdp"
-                    elif "thất nghiệp" in joined or "unemployment" in joined:
-                        indicator = "unemployment"
-                    elif "lãi suất" in joined or "interest" in joined:
-                        indicator = "interest_rate"
-                    else:
-                        indicator = "gdp"
-                    arguments = {"country": country, "indicator": indicator}
-                    
-                elif tool_name == "google_search" or tool_name == "search_news":
-                    # Extract search query
-                    query = "FPT stock news" if found_stock else "stock market news"
-                    arguments = {"query": query}
-                    
-                elif tool_name == "compare_fundamentals" or tool_name == "compare_with_peers":
-                    # Need multiple tickers
-                    tickers = ["FPT.VN", "MWG.VN", "VCB.VN"]
-                    arguments = {"tickers": tickers}
-                    
-                elif tool_name == "get_correlation_matrix":
-                    tickers = ["FPT.VN", "MWG.VN", "VCB.VN"]
-                    arguments = {"tickers": tickers, "period": "1y"}
-                    
-                elif tool_name == "analyze_portfolio":
-                    portfolio = {"FPT.VN": 0.4, "MWG.VN": 0.3, "VCB.VN": 0.3}
-                    arguments = {"portfolio": portfolio}
-                    
-                else:
-                    # Default fallback
-                    arguments = {"ticker": "FPT.VN"}
+                handler = _MOCK_TOOLS.get(tool_name, _mock_default_args)
+                arguments = handler(found_stock, keywords)
                 
                 out["function_call"] = {"name": tool_name, "arguments": arguments}
                 return out
@@ -347,7 +806,8 @@ class GeminiWrapper:
         max_output_tokens: int = 1024,
         function_call: str = "auto",
         use_history: bool = True,
-        save_to_history: bool = True
+        save_to_history: bool = True,
+        response_schema: Optional[Dict] = None
     ) -> Dict[str, Any]:
         """
         Gọi model Gemini qua OpenAI SDK hoặc mock.
@@ -360,87 +820,186 @@ class GeminiWrapper:
             function_call: Function calling mode
             use_history: Whether to include chat history in the request
             save_to_history: Whether to save this exchange to history
+            response_schema: Optional JSON schema the reply must follow (structured output)
             
         Returns:
             dict: {'text': str|None, 'function_call': dict|None, 'raw': raw_response}
+            plus 'json' (the parsed reply, or None) when response_schema is given
         """
-        # Prepare messages with history if enabled
+        # The mock only reads the latest turn, so it never needs the history prepended
+        if not self.use_real or not self.client:
+            return self._mock_generate(messages, tools)
+
+        try:
+            # Gọi Gemini qua OpenAI API
+            request = {
+                "model": self.model,
+                "messages": self._request_messages(messages, use_history),
+                "temperature": temperature,
+                "max_tokens": max_output_tokens,
+            }
+            if tools and response_schema is None:
+                # Tool-capable prompts usually answer with a function_call object; stream so we
+                # can hang up as soon as it is complete instead of waiting out the tail tokens
+                return self._read_stream(
+                    self.client.chat.completions.create(**request, stream=True), messages, save_to_history
+                )
+            if response_schema is None:
+                completion = self.client.chat.completions.create(**request)
+            else:
+                try:
+                    completion = self.client.chat.completions.create(
+                        **request, response_format=_response_format(response_schema)
+                    )
+                except Exception as e:
+                    logger.warning("Structured output request failed (%s); retrying without a schema", e)
+                    completion = self.client.chat.completions.create(**request)
+            return self._parse_completion(completion, messages, save_to_history, response_schema is not None)
+
+        except Exception as e:
+            logger.error("Error calling Gemini via OpenAI SDK: %s. Falling back to MOCK.", e)
+            return self._mock_generate(messages, tools)
+
+    def _request_messages(self, messages: List[Dict], use_history: bool) -> List[Dict[str, str]]:
+        """Prepend history (if enabled) and convert the messages to the OpenAI format"""
         if self.enable_history and use_history and self.history:
             # Combine history messages with current messages
             history_messages = self.history.get_messages()
-            # Avoid duplicating messages if they're already in history
-            combined_messages = history_messages + messages
+            # Avoid duplicating messages if they're already in history: callers often
+            # re-send the turns a previous call just saved, so drop that overlap only
+            overlap = _history_overlap(history_messages, messages)
+            combined_messages = history_messages + messages[overlap:]
         else:
             combined_messages = messages
+
+        # Chuyển đổi messages sang format OpenAI
+        # Gemini qua OpenAI API có thể không support system role tốt
+        # nên ta có thể gộp system message vào user message đầu tiên
+        return [
+            _ROLE_DISPATCH.get(msg.get('role', 'user'), _DEFAULT_ROLE)(msg.get('content', ''))
+            for msg in combined_messages
+        ]
+
+    def _parse_completion(
+        self, completion: Any, messages: List[Dict], save_to_history: bool, parse_json: bool = False
+    ) -> Dict[str, Any]:
+        """Turn a chat completion into the {'text', 'function_call', 'raw'} dict and record history"""
+        out = {"text": None, "function_call": None, "raw": completion}
+        if parse_json:
+            out["json"] = None
+        
+        if completion.choices and len(completion.choices) > 0:
+            message = completion.choices[0].message
+            out["text"] = message.content
+            if parse_json and message.content:
+                # Structured output should parse as-is; callers still get the text if it doesn't
+                try:
+                    out["json"] = json_loads(message.content)
+                except Exception:
+                    logger.debug("Structured reply was not valid JSON")
             
-        if not self.use_real or not self.client:
-            return self._mock_generate(combined_messages, tools)
+            # Note: Function calling có thể không được support
+            # qua OpenAI compatibility layer của Gemini
+            if hasattr(message, 'function_call') and message.function_call:
+                out["function_call"] = {
+                    "name": message.function_call.name,
+                    "arguments": json_loads(message.function_call.arguments) if message.function_call.arguments else {}
+                }
+            self._save_exchange(messages, out["text"], save_to_history)
+        
+        return out
 
+    def _read_stream(self, stream: Any, messages: List[Dict], save_to_history: bool) -> Dict[str, Any]:
+        """Collect a streamed reply, closing the stream early once a leading function_call object is complete"""
+        scanner = _ToolCallScanner()
+        parts = []
         try:
-            # Chuyển đổi messages sang format OpenAI
-            # Gemini qua OpenAI API có thể không support system role tốt
-            # nên ta có thể gộp system message vào user message đầu tiên
-            openai_messages = []
-            
-            for msg in combined_messages:
-                role = msg.get('role', 'user')
-                content = msg.get('content', '')
-                
-                # Gemini qua OpenAI có thể cần điều chỉnh role
-                if role == 'system':
-                    # Chuyển system message thành user message với prefix
-                    openai_messages.append({
-                        "role": "user",
-                        "content": f"[System Instructions]: {content}"
-                    })
-                elif role in ['user', 'assistant']:
-                    openai_messages.append({
-                        "role": role,
-                        "content": content
-                    })
-                else:
-                    # Default to user role
-                    openai_messages.append({
-                        "role": "user",
-                        "content": content
-                    })
-            
-            # Gọi Gemini qua OpenAI API
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=openai_messages,
-                temperature=temperature,
-                max_tokens=max_output_tokens
-            )
-            
-            # Parse response
-            out = {"text": None, "function_call": None, "raw": completion}
-            
-            if completion.choices and len(completion.choices) > 0:
-                message = completion.choices[0].message
-                out["text"] = message.content
-                
-                # Note: Function calling có thể không được support
-                # qua OpenAI compatibility layer của Gemini
-                if hasattr(message, 'function_call') and message.function_call:
-                    out["function_call"] = {
-                        "name": message.function_call.name,
-                        "arguments": json.loads(message.function_call.arguments) if message.function_call.arguments else {}
-                    }
-                    
-                # Save to history if enabled
-                if self.enable_history and save_to_history and self.history and out["text"]:
-                    # Get the last user message from the input
-                    user_msgs = [m for m in messages if m.get('role') == 'user']
-                    if user_msgs:
-                        last_user_msg = user_msgs[-1].get('content', '')
-                        self.history.add_exchange(last_user_msg, out["text"])
-            
-            return out
+            for chunk in stream:
+                text = _chunk_text(chunk)
+                end = scanner.feed(text)
+                if end >= 0:
+                    parts.append(text[:end])
+                    break
+                parts.append(text)
+        finally:
+            stream.close()
+        return self._stream_output(parts, stream, messages, save_to_history)
 
-        except Exception as e:
-            logger.error("Error calling Gemini via OpenAI SDK: %s. Falling back to MOCK.", e)
-            return self._mock_generate(messages, tools)
+    async def _aread_stream(self, stream: Any, messages: List[Dict], save_to_history: bool) -> Dict[str, Any]:
+        """Async counterpart of _read_stream"""
+        scanner = _ToolCallScanner()
+        parts = []
+        try:
+            async for chunk in stream:
+                text = _chunk_text(chunk)
+                end = scanner.feed(text)
+                if end >= 0:
+                    parts.append(text[:end])
+                    break
+                parts.append(text)
+        finally:
+            await stream.close()
+        return self._stream_output(parts, stream, messages, save_to_history)
+
+    def _stream_output(self, parts: List[str], stream: Any, messages: List[Dict], save_to_history: bool) -> Dict[str, Any]:
+        text = "".join(parts) or None
+        self._save_exchange(messages, text, save_to_history)
+        return {"text": text, "function_call": None, "raw": stream}
+
+    def _save_exchange(self, messages: List[Dict], text: Optional[str], save_to_history: bool):
+        # Save to history if enabled
+        if self.enable_history and save_to_history and self.history and text:
+            # Get the last user message from the input
+            user_msgs = [m for m in messages if m.get('role') == 'user']
+            if user_msgs:
+                last_user_msg = user_msgs[-1].get('content', '')
+                self.history.add_exchange(last_user_msg, text)
+
+    def batch_generate(
+        self,
+        batch: List[List[Dict]],
+        tools: Optional[List[Optional[List[Callable]]]] = None,
+        temperature: float = 0.0,
+        max_output_tokens: int = 1024,
+    ) -> List[Dict[str, Any]]:
+        """
+        Answer several independent message lists with one model request.
+        
+        The tasks are sent as one prompt that asks for a JSON array with one
+        {"text", "function_call"} item per task, then split back per caller. Falls back
+        to one generate() per task when the reply can't be parsed, and in mock mode.
+        Batched calls never read or write chat history.
+        
+        Returns:
+            list: one generate()-style dict per task, in order
+        """
+        tools = tools or [None] * len(batch)
+        if len(batch) < 2 or not self.use_real or not self.client:
+            return [
+                self.generate(m, tools=t, temperature=temperature, max_output_tokens=max_output_tokens,
+                              use_history=False, save_to_history=False)
+                for m, t in zip(batch, tools)
+            ]
+
+        out = self.generate(
+            [{"role": "user", "content": _batch_prompt(batch)}],
+            temperature=temperature,
+            max_output_tokens=max_output_tokens * len(batch),
+            use_history=False,
+            save_to_history=False,
+        )
+        items = _parse_batch_reply(out.get("text"), len(batch))
+        if items is None:
+            logger.warning("Batched reply unusable for %d tasks, answering them one by one", len(batch))
+            return [
+                self.generate(m, tools=t, temperature=temperature, max_output_tokens=max_output_tokens,
+                              use_history=False, save_to_history=False)
+                for m, t in zip(batch, tools)
+            ]
+        return [
+            {"text": item["text"], "function_call": item["function_call"], "raw": out.get("raw")}
+            for item in items
+        ]
 
     # ========== History Management Methods ==========
     
@@ -503,7 +1062,62 @@ class GeminiWrapper:
                 self.history.add_message(role, content)
             logger.info(f"Set history context with {len(context_messages)} messages")
 
-    async def agenerate(self, *args, **kwargs):
-        import asyncio
+    async def agenerate(
+        self,
+        messages: List[Dict],
+        tools: Optional[List[Callable]] = None,
+        temperature: float = 0.0,
+        max_output_tokens: int = 1024,
+        function_call: str = "auto",
+        use_history: bool = True,
+        save_to_history: bool = True,
+        response_schema: Optional[Dict] = None
+    ) -> Dict[str, Any]:
+        """
+        Async counterpart of generate(). Real calls go through AsyncOpenAI on the running
+        loop, capped by GEMINI_CONCURRENCY in-flight requests and paced to GEMINI_QPM.
+        """
+        if not self.use_real or not self.client:
+            return self._mock_generate(messages, tools)
+
+        try:
+            request = {
+                "model": self.model,
+                "messages": self._request_messages(messages, use_history),
+                "temperature": temperature,
+                "max_tokens": max_output_tokens,
+            }
+            completions = self._get_aclient().chat.completions
+            async with _THROTTLE.slot():
+                if tools and response_schema is None:
+                    # See generate(): stop reading once a function_call object is complete
+                    return await self._aread_stream(
+                        await completions.create(**request, stream=True), messages, save_to_history
+                    )
+                if response_schema is None:
+                    completion = await completions.create(**request)
+                else:
+                    try:
+                        completion = await completions.create(
+                            **request, response_format=_response_format(response_schema)
+                        )
+                    except Exception as e:
+                        logger.warning("Structured output request failed (%s); retrying without a schema", e)
+                        completion = await completions.create(**request)
+            return self._parse_completion(completion, messages, save_to_history, response_schema is not None)
+
+        except Exception as e:
+            logger.error("Error calling Gemini via AsyncOpenAI: %s. Falling back to MOCK.", e)
+            return self._mock_generate(messages, tools)
+
+    def _get_aclient(self) -> "AsyncOpenAI":
+        # AsyncOpenAI's connection pool belongs to the loop that created it
         loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, lambda: self.generate(*args, **kwargs))
\ No newline at end of file
+        if self._aclient is None or self._aclient_loop is not loop:
+            from openai import AsyncOpenAI
+            self._aclient = AsyncOpenAI(
+                base_url="https://openrouter.ai/api/v1",
+                api_key=_GEMINI_KEY,
+            )
+            self._aclient_loop = loop
+        return self._aclient
\ No newline at end of file
@@ -1,4 +1,6 @@
 # finance_agent/prompts.py
+from string import Formatter
+from typing import List, Optional, Tuple
 
 # Prompt sinh subquestions
 GENERATE_SUBQUESTION_SYSTEM_PROMPT_TEMPLATE = """
@@ -36,7 +38,28 @@ Luôn trả về JSON với cấu trúc sau:
 }
 """
 
+# Structured output schema matching the JSON shape the prompt above asks for
+SUBQUESTION_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "subquestions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "question": {"type": "string"},
+                    "depends_on": {"type": "array", "items": {"type": "integer"}},
+                },
+                "required": ["id", "question", "depends_on"],
+            },
+        },
+    },
+    "required": ["subquestions"],
+}
+
 # Prompt để LLM chọn tool và trả lời subquestion
+# Rendered with render_subq_prompt (str.format syntax): literal braces are doubled
 SUBQUESTION_ANSWER_PROMPT = """
 Hôm nay là {current_datetime}.
 
@@ -148,10 +171,10 @@ Hướng dẫn chọn tool:
 - Biểu đồ giá → generate_price_chart
 
 Trả về JSON theo định dạng:
-{"function_call": {"name": "tên_tool", "arguments": {...}}}
+{{"function_call": {{"name": "tên_tool", "arguments": {{...}}}}}}
 
 Hoặc nếu có thể trả lời trực tiếp không cần tool:
-{"text": "câu trả lời"}
+{{"text": "câu trả lời"}}
 
 Lưu ý: Luôn ưu tiên gọi tool để có dữ liệu chính xác thay vì trả lời trực tiếp.
 """
@@ -171,3 +194,20 @@ Yêu cầu khi viết câu trả lời:
 - Làm nổi bật các con số quan trọng.
 - Tránh lặp lại thông tin không cần thiết.
 """
+
+
+def _precompile(template: str) -> List[Tuple[str, Optional[str]]]:
+    """Split a str.format template once into (literal, field name) pairs."""
+    return [(literal, field) for literal, field, _spec, _conv in Formatter().parse(template)]
+
+
+_SUBQ_PARTS = _precompile(SUBQUESTION_ANSWER_PROMPT)
+
+
+def render_subq_prompt(**fields) -> str:
+    """Render SUBQUESTION_ANSWER_PROMPT without re-parsing it; unknown {fields} are left as-is."""
+    return "".join(
+        literal if name is None
+        else literal + (str(fields[name]) if name in fields else "{" + name + "}")
+        for literal, name in _SUBQ_PARTS
+    )
@@ -5,15 +5,80 @@ Provides centralized error handling and fallback mechanisms.
 
 import requests
 import logging
-from typing import Dict, Any, Optional, List
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import TYPE_CHECKING, Dict, Any, Optional, List, Tuple
 from datetime import datetime
 
+from ..utils import TTLCache, json_loads
+
+if TYPE_CHECKING:
+    import pandas as pd
+
 logger = logging.getLogger(__name__)
 
 # Backend configuration
 BACKEND_BASE_URL = "http://localhost:8000"
 BACKEND_TIMEOUT = 10  # seconds
 
+
+def _build_session() -> requests.Session:
+    """
+    Shared session so back-to-back calls reuse pooled keep-alive connections.
+    Gateway errors are retried briefly; urllib3 only retries idempotent methods,
+    so POSTs (e.g. adding an expense) are never replayed.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(
+            total=2,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False,  # hand the last response to raise_for_status below
+        ),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_SESSION = _build_session()
+
+# Read-only market endpoints are answered from a short-lived cache: one chat turn
+# often asks for the same ticker or candles from several tools. TTLs in seconds.
+RESPONSE_CACHE_TTLS = {
+    "/api/v1/market/ticker-detail": 5,
+    "/api/v1/market/tickers": 5,
+    "/api/v1/price/candles": 15,
+    "/api/v1/market/vn-gainers": 30,
+    "/api/v1/market/vn-losers": 30,
+    "/api/v1/news": 60,
+    "/api/v1/assets": 300,
+}
+_RESPONSE_CACHE = TTLCache(maxsize=2048)
+
+
+def _cache_key(
+    endpoint: str,
+    method: str,
+    params: Optional[Dict[str, Any]],
+    json_data: Optional[Dict[str, Any]],
+    token: Optional[str],
+) -> Optional[Tuple]:
+    """Cache key for a cacheable request, or None (writes, user-scoped calls, other endpoints)."""
+    if method != "GET" or token or json_data is not None or endpoint not in RESPONSE_CACHE_TTLS:
+        return None
+    key = (endpoint, tuple(sorted(params.items())) if params else ())
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
 class BackendAPIError(Exception):
     """Custom exception for backend API errors"""
     pass
@@ -47,6 +112,14 @@ def _make_request(
         BackendAPIError: If request fails
     """
     url = f"{BACKEND_BASE_URL}{endpoint}"
+
+    # Cached responses keep their body, so each parse still gives callers fresh objects
+    cache_key = _cache_key(endpoint, method, params, json_data, token)
+    if cache_key is not None:
+        cached = _RESPONSE_CACHE.get(cache_key)
+        if cached is not None:
+            logger.debug(f"Backend API cache hit: {method} {url} params={params}")
+            return cached
     
     # Initialize headers if None
     if headers is None:
@@ -59,7 +132,7 @@ def _make_request(
     try:
         logger.debug(f"Backend API request: {method} {url} params={params}")
         
-        response = requests.request(
+        response = _SESSION.request(
             method=method,
             url=url,
             params=params,
@@ -69,6 +142,8 @@ def _make_request(
         )
         
         response.raise_for_status()
+        if cache_key is not None:
+            _RESPONSE_CACHE.set(cache_key, response, ttl=RESPONSE_CACHE_TTLS[endpoint])
         return response
         
     except requests.exceptions.Timeout:
@@ -85,6 +160,11 @@ def _make_request(
         raise BackendAPIError(f"Unexpected error: {str(e)}")
 
 
+def _json(response: requests.Response) -> Any:
+    """Parse a response body from its raw bytes (orjson when available)"""
+    return json_loads(response.content)
+
+
 def get_ticker_detail(symbol: str) -> Dict[str, Any]:
     """
     Get detailed ticker information from backend.
@@ -104,7 +184,7 @@ def get_ticker_detail(symbol: str) -> Dict[str, Any]:
         params={"symbol": symbol}
     )
     
-    data = response.json()
+    data = _json(response)
     
     # Normalize: add 'price' field if not exists (use 'close' as price)
     if 'close' in data and 'price' not in data:
@@ -130,7 +210,7 @@ def get_multiple_tickers(symbols: List[str]) -> List[Dict[str, Any]]:
         endpoint="/api/v1/market/tickers",
         params={"symbols": ",".join(symbols)}
     )
-    return response.json()
+    return _json(response)
 
 
 def get_price_candles(
@@ -164,6 +244,62 @@ def get_price_candles(
     Raises:
         BackendAPIError: If request fails
     """
+    data = _candles_payload(symbol, timeframe, limit, start_time, end_time)
+    
+    # Backend returns nested structure: {symbol, timeframe, candles: [...]}
+    # Extract and normalize the candles array
+    try:
+        candles = data['candles']
+    except (KeyError, TypeError):
+        if isinstance(data, list):
+            # Already a list of candles
+            return data
+        raise BackendAPIError(f"Unexpected candle data structure: {type(data)}")
+    # Normalize: ensure 'timestamp' field exists (from 'ts')
+    for candle in candles:
+        if 'ts' in candle and 'timestamp' not in candle:
+            candle['timestamp'] = candle['ts']
+    return candles
+
+
+def get_price_candles_df(
+    symbol: str,
+    timeframe: str = "1d",
+    limit: Optional[int] = None,
+    start_time: Optional[str] = None,
+    end_time: Optional[str] = None
+) -> "pd.DataFrame":
+    """
+    Same candles as get_price_candles, as a pandas DataFrame (one row per candle).
+    
+    For the indicator tools, which work column-wise: the frame is built straight
+    from the payload and 'timestamp' is filled from 'ts' as a single column copy.
+    
+    Raises:
+        BackendAPIError: If request fails
+    """
+    import pandas as pd
+
+    data = _candles_payload(symbol, timeframe, limit, start_time, end_time)
+    try:
+        data = data['candles']
+    except (KeyError, TypeError):
+        if not isinstance(data, list):
+            raise BackendAPIError(f"Unexpected candle data structure: {type(data)}")
+    
+    df = pd.DataFrame(data)
+    if 'ts' in df.columns and 'timestamp' not in df.columns:
+        df['timestamp'] = df['ts']
+    return df
+
+
+def _candles_payload(
+    symbol: str,
+    timeframe: str,
+    limit: Optional[int],
+    start_time: Optional[str],
+    end_time: Optional[str]
+) -> Any:
     params = {
         "symbol": symbol,
         "timeframe": timeframe
@@ -181,22 +317,7 @@ def get_price_candles(
         params=params
     )
     
-    data = response.json()
-    
-    # Backend returns nested structure: {symbol, timeframe, candles: [...]}
-    # Extract and normalize the candles array
-    if isinstance(data, dict) and 'candles' in data:
-        candles = data['candles']
-        # Normalize: ensure 'timestamp' field exists (from 'ts')
-        for candle in candles:
-            if 'ts' in candle and 'timestamp' not in candle:
-                candle['timestamp'] = candle['ts']
-        return candles
-    elif isinstance(data, list):
-        # Already a list of candles
-        return data
-    else:
-        raise BackendAPIError(f"Unexpected candle data structure: {type(data)}")
+    return _json(response)
 
 
 def get_market_news(limit: int = 10) -> List[Dict[str, Any]]:
@@ -222,7 +343,7 @@ def get_market_news(limit: int = 10) -> List[Dict[str, Any]]:
         endpoint="/api/v1/news",
         params={"limit": limit}
     )
-    return response.json()
+    return _json(response)
 
 
 def search_assets(query: str, limit: int = 10) -> List[Dict[str, Any]]:
@@ -243,7 +364,7 @@ def search_assets(query: str, limit: int = 10) -> List[Dict[str, Any]]:
         endpoint="/api/v1/assets",
         params={"q": query, "limit": limit}
     )
-    return response.json()
+    return _json(response)
 
 
 def get_vn_gainers(limit: int = 10) -> List[Dict[str, Any]]:
@@ -252,7 +373,7 @@ def get_vn_gainers(limit: int = 10) -> List[Dict[str, Any]]:
         endpoint="/api/v1/market/vn-gainers",
         params={"limit": limit}
     )
-    return response.json()
+    return _json(response)
 
 
 def get_vn_losers(limit: int = 10) -> List[Dict[str, Any]]:
@@ -261,22 +382,52 @@ def get_vn_losers(limit: int = 10) -> List[Dict[str, Any]]:
         endpoint="/api/v1/market/vn-losers",
         params={"limit": limit}
     )
-    return response.json()
+    return _json(response)
 
 
-def check_backend_health() -> bool:
-    """
-    Check if backend server is healthy and responsive.
-    
-    Returns:
-        True if backend is healthy, False otherwise
-    """
+# Last health probe result; see check_backend_health
+HEALTH_MAX_AGE = 30  # seconds
+_health: Dict[str, Any] = {"value": None, "ts": 0.0, "refreshing": False}
+_health_lock = threading.Lock()
+
+
+def _probe_health() -> bool:
     try:
         response = _make_request(
             endpoint="/api/v1/health",
             timeout=3
         )
-        data = response.json()
+        data = _json(response)
         return data.get("status") == "healthy"
     except:
         return False
+
+
+def _refresh_health() -> bool:
+    value = _probe_health()
+    with _health_lock:
+        _health["value"] = value
+        _health["ts"] = time.monotonic()
+        _health["refreshing"] = False
+    return value
+
+
+def check_backend_health() -> bool:
+    """
+    Check if backend server is healthy and responsive.
+    
+    Stale-while-revalidate: the last result is returned immediately and, once it is
+    older than HEALTH_MAX_AGE, refreshed in a background thread, so callers don't block
+    on the probe timeout while the backend is down. Only the very first call probes inline.
+    
+    Returns:
+        True if backend is healthy, False otherwise
+    """
+    with _health_lock:
+        value = _health["value"]
+        if value is not None:
+            if time.monotonic() - _health["ts"] >= HEALTH_MAX_AGE and not _health["refreshing"]:
+                _health["refreshing"] = True
+                threading.Thread(target=_refresh_health, daemon=True, name="backend-health").start()
+            return value
+    return _refresh_health()
@@ -8,7 +8,7 @@ import logging
 from typing import Dict, Any, Optional
 import pandas as pd
 
-from .backend_api import get_price_candles, BackendAPIError
+from .backend_api import get_price_candles_df, BackendAPIError
 
 logger = logging.getLogger(__name__)
 
@@ -140,19 +140,16 @@ def calculate_moving_average(
         
         # Fetch enough candles for calculation (period * 2 + 20 for EMA warmup)
         limit = max(period * 2 + 20, 100)
-        candles = get_price_candles(
+        df = get_price_candles_df(
             symbol=ticker,
             timeframe=interval,
             limit=limit
         )
         
-        if not candles or len(candles) < period:
-            logger.warning(f"Insufficient data from backend: got {len(candles) if candles else 0}, need {period}")
+        if len(df) < period:
+            logger.warning(f"Insufficient data from backend: got {len(df)}, need {period}")
             raise BackendAPIError("Insufficient candle data")
         
-        # Convert to DataFrame
-        df = pd.DataFrame(candles)
-        
         # Ensure we have close prices
         if 'close' not in df.columns:
             raise BackendAPIError("Missing 'close' column in candle data")
@@ -181,7 +178,7 @@ def calculate_moving_average(
             "current_price": round(current_price, 4),
             "distance_percent": round(distance_pct, 2),
             "signal": signal,
-            "data_points": len(candles),
+            "data_points": len(df),
             "source": "backend-api"
         }
         
@@ -8,7 +8,7 @@ import logging
 from typing import Dict, Any
 import pandas as pd
 
-from .backend_api import get_price_candles, BackendAPIError
+from .backend_api import get_price_candles_df, BackendAPIError
 
 logger = logging.getLogger(__name__)
 
@@ -155,19 +155,16 @@ def calculate_rsi(
         
         # Fetch enough candles for RSI calculation (period * 2 + 20 for warmup)
         limit = max(period * 3 + 20, 100)
-        candles = get_price_candles(
+        df = get_price_candles_df(
             symbol=ticker,
             timeframe=interval,
             limit=limit
         )
         
-        if not candles or len(candles) < period + 1:
-            logger.warning(f"Insufficient data from backend: got {len(candles) if candles else 0}, need {period + 1}")
+        if len(df) < period + 1:
+            logger.warning(f"Insufficient data from backend: got {len(df)}, need {period + 1}")
             raise BackendAPIError("Insufficient candle data for RSI calculation")
         
-        # Convert to DataFrame
-        df = pd.DataFrame(candles)
-        
         # Ensure we have close prices
         if 'close' not in df.columns:
             raise BackendAPIError("Missing 'close' column in candle data")
@@ -208,7 +205,7 @@ def calculate_rsi(
             "current_price": round(current_price, 4),
             "signal": signal,
             "interpretation": interpretation,
-            "data_points": len(candles),
+            "data_points": len(df),
             "source": "backend-api"
         }
         
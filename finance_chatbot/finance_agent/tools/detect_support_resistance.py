@@ -9,7 +9,7 @@ from typing import Dict, Any, List
 import pandas as pd
 import numpy as np
 
-from .backend_api import get_price_candles, BackendAPIError
+from .backend_api import get_price_candles_df, BackendAPIError
 
 logger = logging.getLogger(__name__)
 
@@ -141,19 +141,16 @@ def detect_support_resistance(
         
         limit = period_to_limit.get(period, 90)
         
-        candles = get_price_candles(
+        df = get_price_candles_df(
             symbol=ticker,
             timeframe=interval,
             limit=limit
         )
         
-        if not candles or len(candles) < 20:
-            logger.warning(f"Insufficient data from backend: got {len(candles) if candles else 0}, need at least 20")
+        if len(df) < 20:
+            logger.warning(f"Insufficient data from backend: got {len(df)}, need at least 20")
             raise BackendAPIError("Insufficient candle data")
         
-        # Convert to DataFrame
-        df = pd.DataFrame(candles)
-        
         # Ensure we have required columns
         required_cols = ['open', 'high', 'low', 'close']
         if not all(col in df.columns for col in required_cols):
@@ -193,7 +190,7 @@ def detect_support_resistance(
             "nearest_resistance": round(nearest_resistance, 4) if nearest_resistance else None,
             "support_distance_percent": support_distance,
             "resistance_distance_percent": resistance_distance,
-            "data_points": len(candles),
+            "data_points": len(df),
             "source": "backend-api"
         }
         
@@ -1,11 +1,70 @@
 # finance_agent/utils.py
+import json
 import logging
 import logging.config
 import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
 logger = logging.getLogger(__name__)
 
+# Use orjson for (de)serialization when available, stdlib json otherwise.
+# json_dumps always returns str and keeps non-ASCII characters as-is.
+try:
+    import orjson
+
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def json_dumps(obj: Any, default: Optional[Callable] = None) -> str:
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS).decode("utf-8")
+
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps(obj: Any, default: Optional[Callable] = None) -> str:
+        return json.dumps(obj, ensure_ascii=False, default=default)
+
+    json_loads = json.loads
+
 from .models import AnsweredSubQuestion, SubQuestion
 
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire `ttl` seconds after being set."""
+
+    def __init__(self, maxsize: int = 128, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store value; ttl overrides the cache-wide lifetime for this entry."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
 def get_verbosity() -> bool:
     return os.environ.get("VERBOSE", "False") == "True"
 
@@ -1,7 +1,6 @@
 import sys
 import io
 import uuid
-import json
 import asyncio
 from typing import Dict, Optional, AsyncGenerator
 from datetime import datetime
@@ -16,6 +15,7 @@ sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 sys.stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
 
 from finance_agent.agent import FinancialAgent
+from finance_agent.utils import json_dumps
 
 app = FastAPI(title="Financial Chatbot API")
 
@@ -111,7 +111,7 @@ async def chat(request: ChatRequest):
                 )
                 session["current_model"] = request.model
         
-        result = agent.answer(request.message, token=request.token)
+        result = await agent.aanswer(request.message, token=request.token)
         
         session["history"].append({
             "user_message": request.message,
@@ -133,7 +133,7 @@ async def chat(request: ChatRequest):
 async def event_generator(session_id: str, message: str, model: Optional[str] = None, token: Optional[str] = None) -> AsyncGenerator[str, None]:
     """Generate server-sent events for streaming chat response"""
     if session_id not in sessions:
-        yield f"data: {json.dumps({'error': 'Session not found'})}\n\n"
+        yield f"data: {json_dumps({'error': 'Session not found'})}\n\n"
         return
     
     try:
@@ -168,10 +168,10 @@ async def event_generator(session_id: str, message: str, model: Optional[str] =
         agent.tool_callback = tool_callback
         
         # Send start event
-        yield f"data: {json.dumps({'type': 'start', 'message': 'Processing your request...'})}\n\n"
+        yield f"data: {json_dumps({'type': 'start', 'message': 'Processing your request...'})}\n\n"
         
         # Generate subquestions event
-        yield f"data: {json.dumps({'type': 'reasoning', 'message': 'Analyzing your question and breaking it down...'})}\n\n"
+        yield f"data: {json_dumps({'type': 'reasoning', 'message': 'Analyzing your question and breaking it down...'})}\n\n"
         
         # Create async task to process answer and stream tool events
         import threading
@@ -203,9 +203,9 @@ async def event_generator(session_id: str, message: str, model: Optional[str] =
                     break
                     
                 if event["type"] == "tool_start":
-                    yield f"data: {json.dumps({'type': 'tool_call', 'tool': event['tool_name'], 'question': event.get('question', '')})}\n\n"
+                    yield f"data: {json_dumps({'type': 'tool_call', 'tool': event['tool_name'], 'question': event.get('question', '')})}\n\n"
                 elif event["type"] == "tool_complete":
-                    yield f"data: {json.dumps({'type': 'tool_complete', 'tool': event['tool_name']})}\n\n"
+                    yield f"data: {json_dumps({'type': 'tool_complete', 'tool': event['tool_name']})}\n\n"
                     
             except queue.Empty:
                 await asyncio.sleep(0.05)  # Small delay before checking again
@@ -235,11 +235,11 @@ async def event_generator(session_id: str, message: str, model: Optional[str] =
         streamed_text = ""
         for chunk in chunks:
             streamed_text += chunk
-            yield f"data: {json.dumps({'type': 'content', 'content': streamed_text})}\n\n"
+            yield f"data: {json_dumps({'type': 'content', 'content': streamed_text})}\n\n"
             await asyncio.sleep(0.02)  # Adjust speed of streaming
         
         # Send completion event
-        yield f"data: {json.dumps({'type': 'done', 'final_report': final_report, 'answered_subquestions': result.get('answered_subquestions', [])})}\n\n"
+        yield f"data: {json_dumps({'type': 'done', 'final_report': final_report, 'answered_subquestions': result.get('answered_subquestions', [])})}\n\n"
         
         # Save to history
         session["history"].append({
@@ -249,7 +249,7 @@ async def event_generator(session_id: str, message: str, model: Optional[str] =
         })
         
     except Exception as e:
-        yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+        yield f"data: {json_dumps({'type': 'error', 'error': str(e)})}\n\n"
 
 
 @app.post("/api/chat/stream")